@@ -0,0 +1,977 @@
+import os
+import sys
+import time
+import re
+import glob
+import random
+import subprocess
+import argparse
+import tempfile
+import json
+import shutil
+import datetime
+import tracemalloc
+
+import history
+import manifest
+import generate_gpu_status as gs
+
+# --- SYNTHETIC DATA ---
+
+# (AvailableFeatures, gres model, GPUs per node) for a few typical node types
+SYNTHETIC_MODELS = [
+    ("RTX_2080Ti,rtx_2080ti,RTX_2080,rtx_2080,gpu,location=local", "rtx_2080ti", 8),
+    ("RTX_6000,rtx_6000,gpu,location=local", "rtx_6000", 8),
+    ("RTX_8000,rtx_8000,gpu,location=local", "rtx_8000", 4),
+    ("A100,a100,gpu,location=local", "a100", 4),
+    ("H100,h100,gpu,location=local", "h100", 4),
+]
+
+def synthetic_node_block(index, rng, degraded_rate=0.05):
+    """Returns one fake 'scontrol show node' entry in the real output format."""
+    features, gres_model, count = SYNTHETIC_MODELS[index % len(SYNTHETIC_MODELS)]
+    if rng.random() < degraded_rate:
+        count -= rng.randint(1, count - 1)
+    name = f"g{index:05d}"
+    return (
+        f"NodeName={name} Arch=x86_64 CoresPerSocket=24 \n"
+        f"   CPUAlloc=0 CPUEfctv=48 CPUTot=48 CPULoad=0.01\n"
+        f"   AvailableFeatures={features}\n"
+        f"   ActiveFeatures={features}\n"
+        f"   Gres=gpu:{gres_model}:{count}(S:0-1)\n"
+        f"   GresUsed=gpu:{gres_model}:0(IDX:N/A)\n"
+        f"   NodeAddr={name} NodeHostName={name} Version=23.02.7\n"
+        f"   OS=Linux 4.18.0 #1 SMP \n"
+        f"   RealMemory=380000 AllocMem=0 FreeMem=370000 Sockets=2 Boards=1\n"
+        f"   State=IDLE ThreadsPerCore=1 TmpDisk=0 Weight=1 Owner=N/A MCS_label=N/A\n"
+        f"   Partitions=gpu,gpu-{gres_model} \n"
+        f"   BootTime=2024-01-01T00:00:00 SlurmdStartTime=2024-01-01T00:00:00\n"
+        f"   CfgTRES=cpu=48,mem=380000M,billing=48,gres/gpu={count}\n"
+        f"   AllocTRES=\n"
+        f"   CapWatts=n/a\n"
+        f"   CurrentWatts=0 AveWatts=0\n"
+        f"\n"
+    )
+
+def write_synthetic_dump(path, n_nodes, seed=0):
+    """Writes a synthetic scontrol dump with n_nodes GPU nodes to path."""
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for i in range(n_nodes):
+            f.write(synthetic_node_block(i, rng))
+
+def measure(func):
+    """Runs func once. Returns (result, seconds, peak traced bytes)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+# --- BENCHMARKS ---
+
+def bench_parse(args):
+    """Materialized (check_output + parse_nodes) vs streaming (Popen + iter_nodes)."""
+    n_nodes = args.nodes
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "scontrol.txt")
+        write_synthetic_dump(dump, n_nodes)
+        cmd = ["cat", dump]
+        size_mb = os.path.getsize(dump) / 1e6
+        print(f"Parse benchmark: {n_nodes} nodes, {size_mb:.1f} MB of scontrol output")
+
+        def materialized():
+            raw = subprocess.check_output(cmd, encoding='utf-8')
+            return gs.parse_nodes(raw)
+
+        def streaming():
+            return list(gs.iter_nodes(gs.stream_slurm_data(cmd)))
+
+        results = {}
+        for label, func in [("materialized", materialized), ("streaming", streaming)]:
+            nodes, elapsed, peak = measure(func)
+            results[label] = nodes
+            print(f"  {label:<14} {elapsed:8.3f}s  peak {peak / 1e6:8.1f} MB  ({len(nodes)} nodes)")
+
+        if results["materialized"] != results["streaming"]:
+            print("  WARNING: parsers disagree")
+
+def legacy_regex_fields(block):
+    """The per-block regex scans parse_nodes() used before the tokenizer."""
+    node_name = block.split()[0]
+    feat_match = re.search(r"AvailableFeatures=([^\s]+)", block)
+    raw_features = feat_match.group(1) if feat_match else "Unknown"
+    gres_match = re.search(r"Gres=.*gpu:.*?:?(\d+)", block)
+    if gres_match:
+        gpu_count = int(gres_match.group(1))
+    else:
+        simple_match = re.search(r"Gres=gpu:(\d+)", block)
+        gpu_count = int(simple_match.group(1)) if simple_match else 0
+    return node_name, raw_features, gpu_count
+
+def tokenize_node_block(block):
+    """
+    The tokenizer parse_node_block() used before per-field lookups: splits a
+    node block into a {key: value} map in a single pass over its
+    whitespace-separated tokens. Tokens without a "Key=" prefix continue the
+    previous value (e.g. "OS=Linux 4.18.0 #1 SMP"). The leading bare token
+    is the node name, since blocks start right after "NodeName=".
+    """
+    fields = {}
+    key = None
+    for token in block.split():
+        k, sep, v = token.partition('=')
+        if sep and k.replace('_', '').isalnum():
+            key = k
+            fields[key] = v
+        elif key is None:
+            key = 'NodeName'
+            fields[key] = token
+        else:
+            fields[key] += ' ' + token
+    return fields
+
+NODE_FIELDS = ('Gres', 'GresUsed', 'State', 'Partitions', 'AvailableFeatures', 'CfgTRES', 'AllocTRES')
+NODE_FIELD_PATTERNS = [re.compile(rf"{field}=(\S*)") for field in NODE_FIELDS]
+
+def regex_all_fields(block):
+    """One re.search per field, for every field the tokenizer provides."""
+    fields = {'NodeName': block.split()[0]}
+    for field, pattern in zip(NODE_FIELDS, NODE_FIELD_PATTERNS):
+        match = pattern.search(block)
+        if match:
+            fields[field] = match.group(1)
+    return fields
+
+def tokenizer_fields(block):
+    """Name, features and GPU count via the single-pass tokenizer."""
+    fields = tokenize_node_block(block)
+    gpu_count = gs.gres_gpu_count(fields.get('Gres', ''))
+    return fields['NodeName'], fields.get('AvailableFeatures', "Unknown"), gpu_count
+
+def lookup_fields(block):
+    """Name, features and GPU count via per-field str.find lookups, as parse_node_block() does."""
+    gpu_count = gs.gres_gpu_count(gs.node_field(block, 'Gres'))
+    return block.split(None, 1)[0], gs.node_field(block, 'AvailableFeatures', "Unknown"), gpu_count
+
+def best_of(func, repeat=3):
+    """Best wall time of `repeat` calls, plus the last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+def bench_tokenize(args):
+    """Per-block field extraction: legacy regex scans vs full tokenizer vs per-field lookups."""
+    n_nodes = args.nodes
+    rng = random.Random(0)
+    blocks = [synthetic_node_block(i, rng)[len("NodeName="):] for i in range(n_nodes)]
+    print(f"Tokenizer benchmark: {n_nodes} node blocks")
+
+    variants = [
+        ("legacy regex (3 fields)", legacy_regex_fields),
+        ("regex per field (7 fields)", regex_all_fields),
+        ("tokenizer (all fields)", tokenize_node_block),
+        ("tokenizer + gpu count", tokenizer_fields),
+        ("field lookups + gpu count", lookup_fields),
+        ("parse_node_block", gs.parse_node_block),
+    ]
+    results = {}
+    for label, func in variants:
+        results[label], elapsed = best_of(lambda: [func(block) for block in blocks])
+        print(f"  {label:<28} {elapsed:8.3f}s  {elapsed / n_nodes * 1e6:6.1f} us/node")
+
+    # The legacy Gres regex reads digits out of model names ("gpu:rtx_2080ti:8" -> 2080)
+    legacy, tokenized = results["legacy regex (3 fields)"], results["tokenizer + gpu count"]
+    wrong = sum(1 for a, b in zip(legacy, tokenized) if a != b)
+    print(f"  {wrong} of {n_nodes} nodes parsed differently (legacy regex miscounts "
+          f"Gres entries whose model name contains digits)")
+    if results["field lookups + gpu count"] != tokenized:
+        print("  WARNING: field lookups and tokenizer disagree")
+
+def legacy_expected_counts(nodes):
+    """The peer-group mode generate_report() used before the Counter/bincount stage."""
+    feature_groups = {}
+    for node in nodes:
+        feature_groups.setdefault(node.raw_features, []).append(node.gpu_count)
+    return {feature: max(set(counts), key=counts.count) for feature, counts in feature_groups.items()}
+
+def synthetic_records(n_nodes, n_groups, rng, degraded_rate=0.05):
+    """NodeRecords in a few large feature groups of 8-GPU nodes, some degraded."""
+    nodes = []
+    for i in range(n_nodes):
+        count = 8 - rng.randint(1, 7) if rng.random() < degraded_rate else 8
+        nodes.append(gs.NodeRecord(f"g{i:05d}", f"GROUP_{i % n_groups}", f"Model {i % n_groups}", count,
+                                   partitions=f"gpu,part{i % 3}"))
+    return nodes
+
+def bench_learn(args):
+    """Expected-count learning: legacy list.count mode, Counter, bincount, incremental."""
+    n_nodes = args.nodes
+    rng = random.Random(0)
+    n_groups = 4
+    nodes = synthetic_records(n_nodes, n_groups, rng)
+    print(f"Learning benchmark: {n_nodes} nodes in {n_groups} groups")
+
+    table = gs.ScanTable(nodes)
+    histograms = gs.GroupHistograms()
+    histograms.update(table)
+
+    # Next scan: a handful of nodes lose or regain a GPU
+    changed = list(nodes)
+    for i in rng.sample(range(n_nodes), 10):
+        node = changed[i]
+        changed[i] = gs.NodeRecord(node.name, node.raw_features, node.model_name, node.gpu_count - 1)
+    next_table = gs.ScanTable(changed)
+
+    variants = [
+        ("legacy max(set, list.count)", lambda: legacy_expected_counts(nodes)),
+        ("Counter", lambda: gs.learn_expected_counts(nodes)),
+        ("bincount (ScanTable)", lambda: table.learn_expected()),
+    ]
+    for label, func in variants:
+        _, elapsed = best_of(func)
+        print(f"  {label:<30} {elapsed * 1e3:9.2f} ms")
+
+    # Alternate between the two scans so every update applies 10 changes
+    t0 = time.perf_counter()
+    for _ in range(10):
+        histograms.update(next_table)
+        histograms.update(table)
+    elapsed = (time.perf_counter() - t0) / 20
+    print(f"  {'incremental (10 changed)':<30} {elapsed * 1e3:9.2f} ms")
+
+    expected = gs.learn_expected_counts(nodes)
+    if list(table.learn_expected()) != [expected[g] for g in table.groups]:
+        print("  WARNING: learners disagree")
+
+def synthetic_table(n_nodes, rng, timestamp=None, n_groups=4):
+    """A classified ScanTable for a synthetic cluster."""
+    table = gs.ScanTable(gs.ClusterScan(synthetic_records(n_nodes, n_groups, rng), timestamp))
+    table.classify()
+    return table
+
+def bench_history(args):
+    """Appending scans to the SQLite history and querying it per node and per group."""
+    n_nodes, n_scans = args.nodes, args.scans
+    rng = random.Random(0)
+    start = datetime.datetime(2026, 1, 1)
+    tables = [synthetic_table(n_nodes, rng) for _ in range(4)]
+    print(f"History benchmark: {n_scans} scans x {n_nodes} nodes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = history.ScanHistory(history.connect(os.path.join(tmp, "history.db")))
+        t0 = time.perf_counter()
+        for i in range(n_scans):
+            table = tables[i % len(tables)]
+            table.timestamp = start + datetime.timedelta(hours=12 * i)
+            store.record(table)
+        elapsed = time.perf_counter() - t0
+        print(f"  record                  {elapsed / n_scans * 1e3:9.2f} ms/scan")
+
+        node = tables[0].names[n_nodes // 2]
+        group = tables[0].groups[0]
+        window_start = (start + datetime.timedelta(hours=12 * (n_scans - 60))).isoformat(sep=' ')
+        queries = [
+            ("node history (all scans)", lambda: store.node_history(node)),
+            ("node changes (all scans)", lambda: store.node_changes(node)),
+            ("group history (last month)", lambda: store.group_history(group, since=window_start)),
+        ]
+        for label, func in queries:
+            rows, elapsed = best_of(func)
+            print(f"  {label:<26} {elapsed * 1e3:9.2f} ms  ({len(rows)} rows)")
+
+RENDER_SIZES = (100, 1000, 5000)
+
+def legacy_render(table, filename):
+    """save_cluster_image() as it was before collections: one artist per chassis and LED."""
+    import math
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
+    cols = 5
+    rows = math.ceil(len(table) / cols)
+    fig, ax = plt.subplots(figsize=(14, max(6, rows * 2.0)))
+    ax.set_xlim(0, cols * 3.0)
+    ax.set_ylim(0, rows * 2.5)
+    ax.axis('off')
+    ax.set_title(f"Cluster GPU Slots - {table.timestamp:%Y-%m-%d %H:%M:%S}", fontsize=16,
+                 fontweight='bold', y=0.99)
+
+    node_w, node_h, start_x, start_y = 2.6, 2.0, 0.2, (rows * 2.5) - 2.2
+    led_w, led_h, led_pad_x, led_pad_y = 0.4, 0.3, 0.1, 0.15
+    rows_data = zip(table.names, table.model_names(), table.actual.tolist(), table.expected.tolist())
+    for i, (name, model, actual, expected) in enumerate(rows_data):
+        nx = start_x + (i % cols) * (node_w + 0.4)
+        ny = start_y - (i // cols) * (node_h + 0.5)
+        ax.add_patch(patches.FancyBboxPatch((nx, ny), node_w, node_h, boxstyle="round,pad=0.1",
+                                            linewidth=1.5, edgecolor='#777777', facecolor='#e0e0e0'))
+        ax.text(nx + node_w/2, ny + node_h - 0.3, name, ha='center', fontsize=11,
+                fontweight='bold', color='#2c3e50')
+        ax.text(nx + node_w/2, ny + node_h - 0.6, model, ha='center', fontsize=9,
+                fontstyle='italic', color='#2c3e50')
+        led_cols = math.ceil(expected / 2)
+        led_start_x = nx + (node_w - (led_cols * (led_w + led_pad_x))) / 2 + led_pad_x / 2
+        for slot in range(expected):
+            lr, lc = 1 - slot // led_cols, slot % led_cols
+            ok = slot < actual
+            ax.add_patch(patches.Rectangle((led_start_x + lc * (led_w + led_pad_x),
+                                            ny + 0.3 + lr * (led_h + led_pad_y)),
+                                           led_w, led_h, linewidth=1,
+                                           edgecolor='#27ae60' if ok else '#c0392b',
+                                           facecolor='#2ecc71' if ok else '#e74c3c'))
+    plt.tight_layout()
+    plt.savefig(filename, dpi=100)
+    plt.close()
+
+def bench_render(args):
+    """Per-artist (legacy) vs collection-based save_cluster_image() at several cluster sizes."""
+    print(f"Render benchmark: {', '.join(str(n) for n in RENDER_SIZES)} nodes")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for n_nodes in RENDER_SIZES:
+                table = synthetic_table(n_nodes, random.Random(0))
+                variants = [
+                    ("per-artist", lambda: legacy_render(table, "legacy.png")),
+                    ("collections", lambda: gs.save_cluster_image(table, unchanged='render')),
+                ]
+                for label, func in variants:
+                    try:
+                        _, elapsed = best_of(func, repeat=1)
+                        print(f"  {n_nodes:>6} nodes  {label:<12} {elapsed:8.2f}s")
+                    except ValueError as e:
+                        print(f"  {n_nodes:>6} nodes  {label:<12}   failed: {e}")
+        finally:
+            os.chdir(cwd)
+
+def import_seconds(statement, repeat=3):
+    """Best wall time of running `statement` in a fresh interpreter, minus a bare start."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    def run(code):
+        t0 = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", code], cwd=here)
+        return time.perf_counter() - t0
+    bare = min(run("pass") for _ in range(repeat))
+    return min(run(statement) for _ in range(repeat)) - bare
+
+def bench_backends(args):
+    """matplotlib vs raster renderer: import cost, per-frame time and pixel difference."""
+    import layout
+    import render_raster
+    from PIL import Image
+    import numpy as np
+
+    print("Backend benchmark")
+    startup = [
+        ("matplotlib", "import matplotlib.pyplot, matplotlib.patches, matplotlib.collections"),
+        ("raster", "import render_raster"),
+    ]
+    for label, statement in startup:
+        print(f"  import {label:<12} {import_seconds(statement):8.3f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_nodes in RENDER_SIZES:
+            table = synthetic_table(n_nodes, random.Random(0))
+            geometry = layout.ClusterLayout(table.expected)
+            paths = {}
+            for label, draw in [("matplotlib", gs.draw_cluster_matplotlib),
+                                ("raster", render_raster.draw_cluster)]:
+                paths[label] = os.path.join(tmp, f"{label}_{n_nodes}.png")
+                _, elapsed = best_of(lambda: draw(table, geometry, paths[label]), repeat=1)
+                print(f"  {n_nodes:>6} nodes  {label:<12} {elapsed:8.2f}s")
+
+            if n_nodes > 1000:
+                continue  # full-size comparison arrays would need several GB
+            a = np.asarray(Image.open(paths["matplotlib"]).convert("RGB"), dtype=np.int16)
+            b = np.asarray(Image.open(paths["raster"]).convert("RGB"), dtype=np.int16)
+            diff = np.abs(a - b)
+            print(f"  {n_nodes:>6} nodes  mean abs pixel difference {diff.mean():.2f}/255, "
+                  f"{(diff.max(axis=-1) > 32).mean() * 100:.1f}% of pixels off by more than 32")
+
+def legacy_layout(expected):
+    """The per-node Python loop the renderer used to run for every image."""
+    rows = max(1, -(-len(expected) // 5))
+    start_y = rows * 2.5 - 2.2
+    chassis, leds = [], []
+    for i, count in enumerate(expected):
+        x = 0.2 + (i % 5) * 3.0
+        y = start_y - (i // 5) * 2.5
+        chassis.append((x, y))
+        led_cols = (count + 1) // 2
+        for slot in range(count):
+            col, row = slot % led_cols, slot // led_cols
+            leds.append((x + (2.6 - led_cols * 0.5) / 2 + 0.05 + col * 0.5,
+                         y + 0.3 + (1 - row) * 0.45))
+    return chassis, leds
+
+def bench_layout(args):
+    """Layout geometry: legacy loop vs vectorized ClusterLayout vs the memory cache."""
+    import layout
+
+    table = synthetic_table(args.nodes, random.Random(0))
+    expected = table.expected.tolist()
+    print(f"Layout benchmark: {args.nodes} nodes, {sum(expected)} slots")
+    layout.cached_layout(table.expected)
+    cases = [
+        ("legacy loop", lambda: legacy_layout(expected)),
+        ("ClusterLayout", lambda: layout.ClusterLayout(table.expected)),
+        ("memory cache", lambda: layout.cached_layout(table.expected)),
+    ]
+    for label, func in cases:
+        _, elapsed = best_of(func, repeat=5)
+        print(f"  {label:<15} {elapsed * 1000:9.2f}ms")
+    layout._loaded.clear()
+
+REUSE_SIZES = (100, 1000)
+REUSE_SCANS = 5
+
+def bench_reuse(args):
+    """Resident mode: fresh matplotlib figure per scan vs one reused figure."""
+    import layout
+    from PIL import Image
+    import numpy as np
+
+    print(f"Figure reuse benchmark ({REUSE_SCANS} scans, same topology, changing GPU counts)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_nodes in REUSE_SIZES:
+            table = synthetic_table(n_nodes, random.Random(0))
+            geometry = layout.ClusterLayout(table.expected)
+            rng = np.random.default_rng(0)
+            scans = [np.maximum(table.expected - (rng.random(n_nodes) < 0.05), 0)
+                     for _ in range(REUSE_SCANS)]
+
+            results = {}
+            for label, reuse in [("fresh", False), ("reused", True)]:
+                gs._figure_cache.clear()
+                if reuse:
+                    # The first scan builds the figure either way
+                    gs.draw_cluster_matplotlib(table, geometry, os.path.join(tmp, "warm.png"), reuse=True)
+                start = time.perf_counter()
+                for i, actual in enumerate(scans):
+                    table.actual = actual
+                    gs.draw_cluster_matplotlib(table, geometry, os.path.join(tmp, f"{label}_{i}.png"), reuse=reuse)
+                results[label] = (time.perf_counter() - start) / REUSE_SCANS
+                print(f"  {n_nodes:>6} nodes  {label:<8} {results[label]:8.3f}s per scan")
+            gs._figure_cache.clear()
+
+            same = all(np.array_equal(np.asarray(Image.open(os.path.join(tmp, f"fresh_{i}.png"))),
+                                      np.asarray(Image.open(os.path.join(tmp, f"reused_{i}.png"))))
+                       for i in range(REUSE_SCANS))
+            print(f"  {n_nodes:>6} nodes  speedup {results['fresh'] / results['reused']:.1f}x, "
+                  f"identical output: {same}")
+
+TILE_BENCH_CASES = [("raster", (1000, 5000)), ("matplotlib", (1000,))]
+
+TILE_BENCH_SCRIPT = """
+import os, sys, time, random, resource
+import benchmark, generate_gpu_status as gs
+renderer, n_nodes, tile_by, tile_size, out = sys.argv[1], int(sys.argv[2]), sys.argv[3] or None, int(sys.argv[4]), sys.argv[5]
+os.chdir(out)
+table = benchmark.synthetic_table(n_nodes, random.Random(0))
+start = time.perf_counter()
+gs.save_cluster_image(table, unchanged='render', renderer=renderer, tile_by=tile_by, tile_size=tile_size)
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def bench_tiles(args):
+    """Peak RSS and time of one snapshot vs tiled pages (each run in a fresh process)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("Tiled rendering benchmark (peak RSS of a fresh process)")
+    for renderer, sizes in TILE_BENCH_CASES:
+        for n_nodes in sizes:
+            for mode in ("", "count"):
+                with tempfile.TemporaryDirectory() as tmp:
+                    result = subprocess.run([sys.executable, "-c", TILE_BENCH_SCRIPT,
+                                             renderer, str(n_nodes), mode, str(args.tile_size), tmp],
+                                            cwd=here, capture_output=True, text=True,
+                                            env=dict(os.environ, PYTHONPATH=here))
+                    if result.returncode != 0:
+                        print(result.stderr)
+                        return result.returncode
+                    elapsed, max_rss = result.stdout.split()[-2:]
+                label = f"tiled/{args.tile_size}" if mode else "single"
+                print(f"  {renderer:<11} {n_nodes:>6} nodes  {label:<10} "
+                      f"{float(elapsed):8.2f}s  {int(max_rss) / 1024:8.1f}MB")
+
+def bench_svg(args):
+    """SVG template output vs raster PNG: render time and file size (raw and gzipped)."""
+    import gzip
+    import layout
+    import render_raster
+    import render_svg
+
+    print("SVG benchmark")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_nodes in RENDER_SIZES:
+            table = synthetic_table(n_nodes, random.Random(0))
+            geometry = layout.ClusterLayout(table.expected)
+            render_svg._templates.clear()
+            cases = [
+                ("png (raster)", "png", lambda path: render_raster.draw_cluster(table, geometry, path)),
+                ("svg, new", "svg", lambda path: render_svg.draw_cluster(table, geometry, path)),
+                ("svg, cached", "svg", lambda path: render_svg.draw_cluster(table, geometry, path)),
+            ]
+            for label, ext, draw in cases:
+                path = os.path.join(tmp, f"{n_nodes}.{ext}")
+                _, elapsed = best_of(lambda: draw(path), repeat=1)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                print(f"  {n_nodes:>6} nodes  {label:<13} {elapsed * 1000:9.1f}ms  "
+                      f"{len(data) / 1024:9.1f}KB  gzip {len(gzip.compress(data)) / 1024:8.1f}KB")
+
+GIF_FRAME_COUNTS = (100, 1000, 10000)
+GIF_LEGACY_MAX = 1000  # the legacy encoder holds every frame; more would exhaust RAM
+
+GIF_BENCH_SCRIPT = """
+import sys, time, resource
+from PIL import Image
+import make_gif
+folder, output, legacy = sys.argv[1], sys.argv[2], sys.argv[3] == "legacy"
+start = time.perf_counter()
+if legacy:
+    import glob
+    frames = [Image.open(path) for path in sorted(glob.glob(folder + "/*.png"))]
+    frames[0].save(output, format="GIF", append_images=frames[1:], save_all=True, duration=500, loop=0)
+else:
+    make_gif.create_gif(folder, output)
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def write_synthetic_frames(folder, n_frames, seed=0, change_rate=0.3, link_unchanged=False):
+    """
+    n_frames snapshot-like PNGs: one rendered cluster with a new title each
+    frame and, with probability change_rate, a few slots flipped. With
+    link_unchanged, frames without flips are hard links to the previous
+    one, like generate_gpu_status.py --unchanged link.
+    """
+    import layout
+    import render_raster
+    from PIL import ImageDraw
+
+    rng = random.Random(seed)
+    table = synthetic_table(15, rng)
+    geometry = layout.ClusterLayout(table.expected)
+    base_path = os.path.join(folder, "base.png")
+    render_raster.draw_cluster(table, geometry, base_path)
+    from PIL import Image
+    with Image.open(base_path) as image:
+        base = image.convert("RGB")
+    os.remove(base_path)
+
+    leds = geometry.led_pixel_boxes().tolist()
+    font = render_raster.load_font(layout.TITLE_FONTSIZE, bold=True)
+    start = datetime.datetime(2025, 1, 1)
+    previous = None
+    for i in range(n_frames):
+        timestamp = start + datetime.timedelta(hours=12 * i)
+        path = os.path.join(folder, f"status_{timestamp.strftime('%Y%m%d_%H%M%S')}.png")
+        flipped = rng.sample(leds, 3) if rng.random() < change_rate else []
+        if link_unchanged and previous and not flipped:
+            os.link(previous, path)
+            continue
+        frame = base.copy()
+        draw = ImageDraw.Draw(frame)
+        draw.rectangle((0, 0, frame.width, layout.TITLE_BAND_PX - 1), fill=layout.C_BACKGROUND)
+        draw.text((frame.width / 2, layout.TITLE_BASELINE_PX), layout.title_text(timestamp),
+                  font=font, fill='#000000', anchor='ms')
+        for box in flipped:
+            draw.rectangle(box, fill=layout.C_LED_MISS, outline=layout.C_LED_MISS_EDGE)
+        frame.save(path, compress_level=1)
+        previous = path
+
+def write_synthetic_history(folder, n_scans, n_nodes=15, seed=0, change_rate=0.3, pngs=True):
+    """
+    n_scans scans of one synthetic cluster, 12 hours apart, where with
+    probability change_rate a few nodes lose or regain a GPU. Stored like
+    generate_gpu_status.py does: scan states in folder/states, with
+    pngs=True raster-rendered snapshots in folder, and the manifest.
+    """
+    import layout
+    import render_raster
+
+    rng = random.Random(seed)
+    table = synthetic_table(n_nodes, rng)
+    baseline = table.actual.copy()
+    geometry = layout.ClusterLayout(table.expected)
+    states = os.path.join(folder, "states")
+    start = datetime.datetime(2025, 1, 1)
+    for i in range(n_scans):
+        table.timestamp = start + datetime.timedelta(hours=12 * i)
+        if rng.random() < change_rate:
+            table.actual = baseline.copy()
+            for node in rng.sample(range(n_nodes), min(3, n_nodes)):
+                table.actual[node] -= rng.randint(1, 3)
+        state_path = gs.save_scan_state(table, states)
+        image_path = None
+        if pngs:
+            stamp = table.timestamp.strftime('%Y%m%d_%H%M%S')
+            image_path = os.path.join(folder, f"status_{stamp}.png")
+            render_raster.draw_cluster(table, geometry, image_path)
+        manifest.append(folder, table.timestamp, table.state_hash(), image_path, state_path)
+
+def bench_gif(args):
+    """GIF assembly: peak RSS and time of the streaming writer vs the legacy all-frames-open save."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("GIF benchmark (1400x600 frames, peak RSS of a fresh process)")
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = os.path.join(tmp, "all")
+        os.makedirs(frames)
+        write_synthetic_frames(frames, max(GIF_FRAME_COUNTS))
+        names = sorted(os.listdir(frames))
+        for n_frames in GIF_FRAME_COUNTS:
+            folder = os.path.join(tmp, str(n_frames))
+            os.makedirs(folder)
+            for name in names[:n_frames]:
+                os.link(os.path.join(frames, name), os.path.join(folder, name))
+
+            for mode in ("legacy", "streaming"):
+                if mode == "legacy" and n_frames > GIF_LEGACY_MAX:
+                    continue
+                output = os.path.join(tmp, f"{mode}_{n_frames}.gif")
+                result = subprocess.run([sys.executable, "-c", GIF_BENCH_SCRIPT, folder, output, mode],
+                                        cwd=here, capture_output=True, text=True,
+                                        env=dict(os.environ, PYTHONPATH=here))
+                if result.returncode != 0:
+                    print(result.stderr)
+                    return result.returncode
+                elapsed, max_rss = result.stdout.split()[-2:]
+                print(f"  {n_frames:>6} frames  {mode:<10} {float(elapsed):8.2f}s  "
+                      f"{int(max_rss) / 1024:8.1f}MB  {os.path.getsize(output) / 1024:9.1f}KB")
+            shutil.rmtree(folder)
+
+GIF_COLLAPSE_FRAMES = 1000
+GIF_COLLAPSE_CHANGE_RATE = 0.02  # a stable cluster: slots change in ~1 of 50 scans
+
+def bench_gif_collapse(args):
+    """History GIF of a stable cluster: every snapshot a frame vs collapsing repeats."""
+    import contextlib
+    import io
+    import make_gif
+
+    print(f"GIF repeat-collapsing benchmark ({GIF_COLLAPSE_FRAMES} snapshots, "
+          f"{GIF_COLLAPSE_CHANGE_RATE:.0%} with slot changes)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for link_unchanged in (False, True):
+            folder = os.path.join(tmp, f"linked_{link_unchanged}")
+            os.makedirs(folder)
+            write_synthetic_frames(folder, GIF_COLLAPSE_FRAMES, change_rate=GIF_COLLAPSE_CHANGE_RATE,
+                                   link_unchanged=link_unchanged)
+            snapshots = "hard-linked repeats" if link_unchanged else "rendered repeats"
+            for label, collapse in [("every snapshot", False), ("collapsed", True)]:
+                output = os.path.join(tmp, "out.gif")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    make_gif.create_gif(folder, output, collapse=collapse)
+                elapsed = time.perf_counter() - start
+                with open(make_gif.state_path(output)) as f:
+                    frames = json.load(f)['frames']
+                print(f"  {snapshots:<20} {label:<15} {elapsed:8.2f}s  {frames:>5} frames  "
+                      f"{os.path.getsize(output) / 1024:8.1f}KB")
+
+GIF_STATES_SCANS = 500
+GIF_STATES_NODES = (15, 100)
+
+def bench_gif_states(args):
+    """History GIF drawn from stored scan states vs decoded from the PNG snapshots."""
+    import contextlib
+    import io
+    import make_gif
+
+    print(f"GIF from scan states benchmark ({GIF_STATES_SCANS} scans, 30% with slot changes)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_nodes in GIF_STATES_NODES:
+            folder = os.path.join(tmp, str(n_nodes))
+            write_synthetic_history(folder, GIF_STATES_SCANS, n_nodes)
+            pngs = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".png")]
+            states = os.path.join(folder, "states")
+            states = [os.path.join(states, name) for name in os.listdir(states)]
+            for label, from_states, files in [("decode PNGs", False, pngs), ("scan states", True, states)]:
+                output = os.path.join(tmp, "out.gif")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    make_gif.create_gif(folder, output, from_states=from_states)
+                elapsed = time.perf_counter() - start
+                stored = sum(os.path.getsize(path) for path in files) / GIF_STATES_SCANS
+                print(f"  {n_nodes:>4} nodes  {label:<12} {elapsed:8.2f}s  "
+                      f"{elapsed / GIF_STATES_SCANS * 1e3:7.2f} ms/scan  "
+                      f"GIF {os.path.getsize(output) / 1024:8.1f}KB  stored {stored / 1024:7.1f}KB/scan")
+
+TIMELINE_BENCH_NODES = 200
+
+def bench_timeline(args):
+    """Whole-history heatmap from the SQLite history vs the history GIF drawn from scan states."""
+    import contextlib
+    import io
+    import make_gif
+    import timeline
+
+    n_nodes, n_scans = TIMELINE_BENCH_NODES, args.scans
+    rng = random.Random(0)
+    table = synthetic_table(n_nodes, rng)
+    baseline = table.actual.copy()
+    print(f"Timeline benchmark: {n_scans} scans x {n_nodes} nodes")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = history.ScanHistory(history.connect(os.path.join(tmp, "history.db")))
+        states = os.path.join(tmp, "states")
+        start = datetime.datetime(2025, 1, 1)
+        for i in range(n_scans):
+            table.timestamp = start + datetime.timedelta(hours=12 * i)
+            if rng.random() < 0.3:
+                table.actual = baseline.copy()
+                for node in rng.sample(range(n_nodes), 3):
+                    table.actual[node] -= rng.randint(1, 3)
+                table.classify(node_expected=table.expected)
+            store.record(table)
+            path = gs.save_scan_state(table, states)
+            manifest.append(tmp, table.timestamp, table.state_hash(), state=path)
+
+        matrix, build = best_of(store.slot_matrix, repeat=1)
+        image, draw = best_of(lambda: timeline.render(*matrix), repeat=1)
+        output = os.path.join(tmp, "timeline.png")
+        _, save = best_of(lambda: image.save(output), repeat=1)
+        total = build + draw + save
+        print(f"  timeline PNG    {total:8.2f}s  (query {build:.2f}s, draw {draw:.2f}s, save {save:.2f}s)  "
+              f"{image.width}x{image.height}  {os.path.getsize(output) / 1024:8.1f}KB")
+
+        output = os.path.join(tmp, "history.gif")
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            make_gif.create_gif(tmp, output, from_states=True)
+        elapsed = time.perf_counter() - begin
+        print(f"  GIF from states {elapsed:8.2f}s  {os.path.getsize(output) / 1024:8.1f}KB  "
+              f"(timeline takes {total / elapsed:.1%} of it)")
+
+GIF_WORKER_FRAMES = 1000
+
+def bench_gif_workers(args):
+    """PNG history GIF with snapshots decoded and quantized by 1 vs --workers processes."""
+    import contextlib
+    import io
+    import make_gif
+
+    print(f"GIF worker benchmark ({GIF_WORKER_FRAMES} snapshots, every one a frame, "
+          f"{os.cpu_count()} CPUs)")
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic_frames(tmp, GIF_WORKER_FRAMES)
+        output = os.path.join(tmp, "out.gif")
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                make_gif.create_gif(tmp, output, collapse=False, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"  {workers:>3} workers  {elapsed:8.2f}s  {GIF_WORKER_FRAMES / elapsed:7.1f} frames/s  "
+                  f"{os.path.getsize(output) / 1024:8.1f}KB")
+
+GIF_APPEND_HISTORY = (100, 1000)
+
+def bench_gif_append(args):
+    """Adding one new snapshot to the history GIF: incremental append vs full re-encode."""
+    import contextlib
+    import io
+    import make_gif
+
+    print("GIF append benchmark (one new 1400x600 frame)")
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = os.path.join(tmp, "all")
+        os.makedirs(frames)
+        write_synthetic_frames(frames, max(GIF_APPEND_HISTORY) + 1)
+        names = sorted(os.listdir(frames))
+        for history_len in GIF_APPEND_HISTORY:
+            folder = os.path.join(tmp, str(history_len))
+            os.makedirs(folder)
+            for name in names[:history_len]:
+                os.link(os.path.join(frames, name), os.path.join(folder, name))
+            output = os.path.join(tmp, f"{history_len}.gif")
+            with contextlib.redirect_stdout(io.StringIO()):
+                make_gif.create_gif(folder, output)
+            os.link(os.path.join(frames, names[history_len]), os.path.join(folder, names[history_len]))
+
+            for label, incremental in [("full re-encode", False), ("incremental", True)]:
+                with open(output, 'rb') as f:
+                    before = f.read()
+                with open(make_gif.state_path(output)) as f:
+                    state = f.read()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    make_gif.create_gif(folder, output, incremental=incremental)
+                elapsed = time.perf_counter() - start
+                if not incremental:
+                    # Put the previous build back so the incremental run has something to append to
+                    with open(output, 'wb') as f:
+                        f.write(before)
+                    with open(make_gif.state_path(output), 'w') as f:
+                        f.write(state)
+                print(f"  {history_len:>6} frames of history  {label:<15} {elapsed:8.3f}s")
+            shutil.rmtree(folder)
+
+VIEW_BENCH_NODES = 500
+
+def bench_views(args):
+    """Full snapshot plus partition/model/degraded views: serial vs a process pool."""
+    table = synthetic_table(VIEW_BENCH_NODES, random.Random(0))
+    print(f"Multi-view benchmark: {VIEW_BENCH_NODES} nodes, {os.cpu_count()} CPUs")
+    for renderer in ("raster", "matplotlib"):
+        for workers in sorted({1, args.workers}):
+            with tempfile.TemporaryDirectory() as tmp:
+                # Not named 'full', which would write to the layout cache under images/
+                jobs = [('all nodes', table, os.path.join(tmp, "full.png"), None)]
+                jobs += gs.view_jobs(table, gs.VIEWS, tmp)
+                start = time.perf_counter()
+                times = gs.run_render_jobs(jobs, renderer, workers)
+                elapsed = time.perf_counter() - start
+            print(f"  {renderer:<11} {len(jobs)} images  {workers:>2} workers  "
+                  f"{elapsed:7.2f}s wall, {sum(times):7.2f}s summed per-view")
+
+TEXT_PATH_FORBIDDEN = ('matplotlib', 'PIL')
+
+def bench_importtime(args):
+    """
+    Import-time budget for the text-only path, from `python -X importtime`.
+    Returns a non-zero exit status if importing generate_gpu_status takes
+    longer than --budget or pulls in a plotting library.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(3):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import generate_gpu_status"],
+                                cwd=here, capture_output=True, text=True, check=True)
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(cumulative_us)
+        total = modules["generate_gpu_status"] / 1e6
+        best = total if best is None else min(best, total)
+
+    forbidden = sorted(name for name in modules if name.split('.')[0] in TEXT_PATH_FORBIDDEN)
+    print(f"Import-time budget: generate_gpu_status {best:.3f}s (budget {args.budget:.3f}s)")
+    failed = False
+    if best > args.budget:
+        print("  FAIL: text path import time is over budget")
+        failed = True
+    if forbidden:
+        print(f"  FAIL: text path imports plotting modules: {', '.join(forbidden[:5])}")
+        failed = True
+    if not failed:
+        print("  OK")
+    return 1 if failed else 0
+
+FORMATS_BENCH_SCANS = 300
+FORMATS_BENCH_NODES = 100
+
+def bench_formats(args):
+    """History animation as GIF, animated WebP and APNG: encode time and file size."""
+    import contextlib
+    import io
+    import make_gif
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.images
+        if folder is None:
+            folder = os.path.join(tmp, "images")
+            write_synthetic_history(folder, FORMATS_BENCH_SCANS, FORMATS_BENCH_NODES)
+            print(f"Animation format benchmark: synthetic history, {FORMATS_BENCH_SCANS} scans x "
+                  f"{FORMATS_BENCH_NODES} nodes (use --images for a real one)")
+        else:
+            print(f"Animation format benchmark: {folder}")
+        for label, from_states in [("decode PNGs", False), ("scan states", True)]:
+            if not make_gif.find_snapshots(folder, 'states' if from_states else 'png'):
+                continue
+            sizes = {}
+            for ext in (".gif", ".webp", ".png"):
+                output = os.path.join(tmp, "history" + ext)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    make_gif.create_gif(folder, output, from_states=from_states, workers=args.workers)
+                elapsed = time.perf_counter() - start
+                sizes[ext] = os.path.getsize(output)
+                print(f"  {label:<12} {ext[1:].upper() if ext != '.png' else 'APNG':<5} {elapsed:8.2f}s  "
+                      f"{sizes[ext] / 1024:9.1f}KB  ({sizes[ext] / sizes['.gif']:.0%} of the GIF)")
+
+MANIFEST_BENCH_SCANS = 100000  # a scan every 5 minutes for a year
+
+def bench_manifest(args):
+    """Picking a week of snapshots from the manifest vs listing and sorting the images folder."""
+    import make_gif
+
+    n_scans = MANIFEST_BENCH_SCANS
+    print(f"Snapshot selection benchmark: {n_scans} scans (PNG + scan state each)")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "states"))
+        start = datetime.datetime(2025, 1, 1)
+        with open(manifest.manifest_path(tmp), 'w') as f:
+            for i in range(n_scans):
+                timestamp = start + datetime.timedelta(minutes=5 * i)
+                stamp = timestamp.strftime('%Y%m%d_%H%M%S')
+                image = f"status_{stamp}.png"
+                state = os.path.join("states", f"status_{stamp}.npz")
+                for name in (image, state):
+                    open(os.path.join(tmp, name), 'wb').close()
+                f.write(f"{timestamp.isoformat(sep=' ')}\t{i % 7:040x}\t{image}\t{state}\n")
+
+        since, until = '2025-06-01', '2025-06-08'
+
+        def listing():
+            images = sorted(glob.glob(os.path.join(tmp, "status_*.png")))
+            first, last = (os.path.join(tmp, f"status_{day.replace('-', '')}") for day in (since, until))
+            return [path for path in images if first <= path < last]
+
+        for label, func in [
+            ("glob + sort", listing),
+            ("manifest", lambda: make_gif.find_snapshots(tmp, 'png', since, until)),
+            ("manifest --every 1h", lambda: make_gif.find_snapshots(tmp, 'png', since, until,
+                                                                    manifest.parse_interval('1h'))),
+        ]:
+            selected, elapsed = best_of(func)
+            print(f"  {label:<20} {elapsed * 1e3:9.1f} ms  {len(selected)} snapshots")
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'tokenize': bench_tokenize,
+    'learn': bench_learn,
+    'history': bench_history,
+    'render': bench_render,
+    'backends': bench_backends,
+    'reuse': bench_reuse,
+    'layout': bench_layout,
+    'tiles': bench_tiles,
+    'views': bench_views,
+    'svg': bench_svg,
+    'gif': bench_gif,
+    'gifappend': bench_gif_append,
+    'gifcollapse': bench_gif_collapse,
+    'gifstates': bench_gif_states,
+    'gifworkers': bench_gif_workers,
+    'timeline': bench_timeline,
+    'manifest': bench_manifest,
+    'formats': bench_formats,
+    'importtime': bench_importtime,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the GPU status tools")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help="Which benchmark to run")
+    parser.add_argument('--nodes', type=int, default=20000,
+                        help="Synthetic cluster size (default: 20000)")
+    parser.add_argument('--scans', type=int, default=730,
+                        help="Number of scans for history benchmarks (default: 730, a year twice daily)")
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help="Seconds allowed for the text-only import path (default: 0.5)")
+    parser.add_argument('--tile-size', type=int, default=100,
+                        help="Nodes per page for the tiles benchmark (default: 100)")
+    parser.add_argument('--images',
+                        help="Snapshot folder with a real history for the formats benchmark (default: synthetic)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Pool size for the views, gifworkers and formats benchmarks (default: 4)")
+    args = parser.parse_args(argv)
+    return BENCHMARKS[args.benchmark](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
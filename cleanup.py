@@ -1,11 +1,15 @@
 import os
 import glob
+import shutil
 
 def clean_files():
     # define folders to clean
     directories = ['.', 'images']
-    # define file types to remove
-    extensions = ['*.png', '*.gif']
+    # define file types to remove (including the scan history database, scan states, the manifest
+    # and files left by interrupted builds)
+    extensions = ['*.png', '*.svg', '*.gif', '*.webp', '*.apng', '*.gif.state', '*.partial',
+                  'gpu_history.db*', 'manifest.tsv',
+                  os.path.join('states', '*.npz')]
 
     print("Starting cleanup...")
     count = 0
@@ -28,6 +32,19 @@ def clean_files():
                 except OSError as e:
                     print(f"Error removing {file_path}: {e}")
 
+    # Tiled snapshots and extra views live in one directory per scan
+    for parent in [os.path.join('images', 'tiles'), os.path.join('images', 'views')]:
+        if not os.path.isdir(parent):
+            continue
+        for scan_dir in sorted(os.listdir(parent)):
+            scan_dir = os.path.join(parent, scan_dir)
+            try:
+                shutil.rmtree(scan_dir)
+                print(f"Removed: {scan_dir}")
+                count += 1
+            except OSError as e:
+                print(f"Error removing {scan_dir}: {e}")
+
     print(f"-" * 30)
     print(f"Cleanup complete. Removed {count} files.")
 
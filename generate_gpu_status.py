@@ -1,14 +1,35 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 import subprocess
 import re
+import io
 import os
+import sys
+import signal
+import argparse
+import hashlib
+import html
 import datetime
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from collections import defaultdict
-import math
+import threading
+import functools
+import operator
+import numpy as np
+import history
+import layout
+import manifest
+from collections import Counter, defaultdict
+
+# matplotlib (and Pillow for the raster renderer) are imported inside the
+# render path only, so text-only runs never pay for them.
+
+# Time spent importing modules. A cron run pays this on every scan; daemon
+# mode pays it (and the first render's plotting imports) once.
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 # --- HELPER FUNCTIONS ---
 
+@functools.lru_cache(maxsize=None)
 def extract_model_name(features_str):
     """
     Attempts to pick the most readable GPU model name from the feature string.
@@ -34,197 +55,996 @@ def extract_model_name(features_str):
     best_name = max(candidates, key=len)
     return best_name
 
+# --- DATA MODEL ---
+
+class NodeRecord:
+    """
+    One GPU node from a scan. Slotted (no per-instance dict) and with
+    interned feature/model/state strings, since many nodes share them.
+    """
+    __slots__ = ('name', 'raw_features', 'model_name', 'gpu_count', 'state', 'partitions')
+
+    def __init__(self, name, raw_features, model_name, gpu_count, state='', partitions=''):
+        self.name = name
+        self.raw_features = sys.intern(raw_features)
+        self.model_name = sys.intern(model_name)
+        self.gpu_count = gpu_count
+        self.state = sys.intern(state)
+        self.partitions = sys.intern(partitions)
+
+    def astuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, NodeRecord):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __hash__(self):
+        return hash(self.astuple())
+
+    def __repr__(self):
+        return f"NodeRecord({self.name!r}, {self.model_name!r}, gpu_count={self.gpu_count})"
+
+class ClusterScan:
+    """All GPU nodes from one scan, sorted by name, plus the scan time."""
+    __slots__ = ('nodes', 'timestamp')
+
+    def __init__(self, nodes, timestamp=None):
+        self.nodes = sorted(nodes, key=operator.attrgetter('name'))
+        self.timestamp = timestamp or datetime.datetime.now()
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, index):
+        return self.nodes[index]
+
+# --- COLUMNAR SCAN TABLE ---
+
+STATUS_OK = 0
+STATUS_DEGRADED = 1
+STATUS_OVER = 2
+
+STATUS_LABELS = {
+    STATUS_OK: "\033[92mOK\033[0m",
+    STATUS_DEGRADED: "\033[91mDEGRADED\033[0m",
+    STATUS_OVER: "\033[93mOVER\033[0m",
+}
+
+def dictionary_encode(values):
+    """Maps strings to dense integer codes. Returns (codes, distinct values in code order)."""
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values),
+                        dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+class ScanTable:
+    """
+    Columnar form of a scan. Row i is node id i (nodes sorted by name); each
+    column is a NumPy array, and strings are dictionary-encoded:
+    groups[group_id[i]] is the raw feature string node i is compared within.
+    expected/status are filled in by classify().
+    """
+    __slots__ = ('names', 'groups', 'group_models', 'partitions', 'states',
+                 'node_id', 'group_id', 'partition_id', 'state_id',
+                 'actual', 'expected', 'status', 'timestamp')
+
+    def __init__(self, scan):
+        if not isinstance(scan, ClusterScan):
+            scan = ClusterScan(scan)
+        nodes = scan.nodes
+        n = len(nodes)
+
+        self.timestamp = scan.timestamp
+        self.names = [node.name for node in nodes]
+        self.node_id = np.arange(n, dtype=np.int32)
+        self.group_id, self.groups = dictionary_encode([node.raw_features for node in nodes])
+        self.group_models = [extract_model_name(features) for features in self.groups]
+        self.partition_id, self.partitions = dictionary_encode([node.partitions for node in nodes])
+        self.state_id, self.states = dictionary_encode([node.state for node in nodes])
+        self.actual = np.fromiter((node.gpu_count for node in nodes), dtype=np.int32, count=n)
+        self.expected = np.zeros(n, dtype=np.int32)
+        self.status = np.zeros(n, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.names)
+
+    def learn_expected(self):
+        """
+        Peer-group mode of the GPU count for every feature group at once:
+        a single bincount over (group, count) pairs, then argmax per group.
+        Ties go to the lowest count.
+        """
+        width = int(self.actual.max()) + 1 if len(self) else 1
+        hist = np.bincount(self.group_id * width + self.actual,
+                           minlength=len(self.groups) * width)
+        return hist.reshape(len(self.groups), width).argmax(axis=1).astype(np.int32)
+
+    def classify(self, group_expected=None, node_expected=None):
+        """
+        Fills the expected/status columns, either from per-node expected counts
+        or from per-group expected counts (learned from this scan if omitted).
+        """
+        if node_expected is not None:
+            self.expected = np.asarray(node_expected, dtype=np.int32)
+        else:
+            if group_expected is None:
+                group_expected = self.learn_expected()
+            self.expected = np.asarray(group_expected, dtype=np.int32)[self.group_id]
+        self.status = np.select([self.actual < self.expected, self.actual > self.expected],
+                                [STATUS_DEGRADED, STATUS_OVER], STATUS_OK).astype(np.int8)
+
+    def state_hash(self):
+        """Hash of everything a rendered snapshot shows, except the timestamp."""
+        digest = hashlib.sha1()
+        digest.update("\0".join(self.names).encode())
+        digest.update("\0".join(self.group_models).encode())
+        for column in (self.group_id, self.actual, self.expected, self.status):
+            digest.update(column.tobytes())
+        return digest.hexdigest()
+
+    def partition_hash(self):
+        """Hash of which partitions every node is in."""
+        digest = hashlib.sha1()
+        digest.update("\0".join(self.partitions).encode())
+        digest.update(self.partition_id.tobytes())
+        return digest.hexdigest()
+
+    def topology_hash(self):
+        """Hash of what fixes the image layout: node names, models and expected counts."""
+        digest = hashlib.sha1()
+        digest.update("\0".join(self.names).encode())
+        digest.update("\0".join(self.group_models).encode())
+        digest.update(self.group_id.tobytes())
+        digest.update(self.expected.tobytes())
+        return digest.hexdigest()
+
+    def take(self, rows):
+        """A ScanTable of just the given rows, in that order, sharing the string dictionaries."""
+        rows = np.asarray(rows, dtype=np.int64)
+        part = ScanTable.__new__(ScanTable)
+        part.timestamp = self.timestamp
+        part.names = [self.names[i] for i in rows.tolist()]
+        part.groups = self.groups
+        part.group_models = self.group_models
+        part.partitions = self.partitions
+        part.states = self.states
+        for column in ('node_id', 'group_id', 'partition_id', 'state_id', 'actual', 'expected', 'status'):
+            setattr(part, column, getattr(self, column)[rows])
+        return part
+
+    def model_names(self):
+        """Display model name for every row."""
+        return [self.group_models[g] for g in self.group_id.tolist()]
+
+    STRINGS = ('names', 'groups', 'group_models', 'partitions', 'states')
+    COLUMNS = ('group_id', 'partition_id', 'state_id', 'actual', 'expected', 'status')
+    # What only changes with the topology, stored once for many scans
+    TOPOLOGY = ('names', 'groups', 'group_models', 'group_id', 'expected')
+
+    def to_arrays(self):
+        """Everything needed to rebuild this table, as a dict of NumPy arrays."""
+        arrays = {name: np.array(getattr(self, name), dtype=str) for name in self.STRINGS}
+        arrays.update((name, getattr(self, name)) for name in self.COLUMNS)
+        arrays['timestamp'] = np.array(self.timestamp.isoformat())
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Inverse of to_arrays()."""
+        self = cls.__new__(cls)
+        for name in cls.STRINGS:
+            setattr(self, name, arrays[name].tolist())
+        for name in cls.COLUMNS:
+            setattr(self, name, arrays[name])
+        self.node_id = np.arange(len(self.names), dtype=np.int32)
+        self.timestamp = datetime.datetime.fromisoformat(str(arrays['timestamp']))
+        return self
+
+# --- PEER-GROUP LEARNING ---
+
+def group_mode(histogram):
+    """Most common GPU count in a {count: nodes} Counter. Ties go to the lowest count."""
+    return min(histogram.items(), key=lambda item: (-item[1], item[0]))[0]
+
+def learn_expected_counts(nodes):
+    """{raw_features: expected count} from one pass over NodeRecords."""
+    histograms = defaultdict(Counter)
+    for node in nodes:
+        histograms[node.raw_features][node.gpu_count] += 1
+    return {feature: group_mode(histogram) for feature, histogram in histograms.items()}
+
+class GroupHistograms:
+    """
+    Per-feature-group GPU count histograms kept across scans by a resident
+    process. update() only touches the nodes that changed since the last
+    scan, and only groups with changes get their mode recomputed.
+    """
+
+    def __init__(self):
+        self.histograms = defaultdict(Counter)
+        self.modes = {}
+        self.node_state = {}  # name -> (raw_features, gpu_count)
+        self._last_table = None
+
+    def _add(self, feature, count, dirty):
+        self.histograms[feature][count] += 1
+        dirty.add(feature)
+
+    def _remove(self, feature, count, dirty):
+        histogram = self.histograms[feature]
+        histogram[count] -= 1
+        if histogram[count] <= 0:
+            del histogram[count]
+        if not histogram:
+            del self.histograms[feature]
+        dirty.add(feature)
+
+    def update(self, table):
+        """Applies a new ScanTable. Returns how many nodes were added, removed or changed."""
+        dirty = set()
+        last = self._last_table
+        same_layout = (last is not None and table.names == last.names
+                       and table.groups == last.groups
+                       and np.array_equal(table.group_id, last.group_id))
+
+        if same_layout:
+            # Same nodes in the same groups: only GPU counts can differ
+            changed = np.flatnonzero(table.actual != last.actual).tolist()
+            for i in changed:
+                feature = table.groups[table.group_id[i]]
+                old, new = int(last.actual[i]), int(table.actual[i])
+                self._remove(feature, old, dirty)
+                self._add(feature, new, dirty)
+                self.node_state[table.names[i]] = (feature, new)
+            n_changed = len(changed)
+        else:
+            current = {}
+            for name, group, count in zip(table.names, table.group_id.tolist(), table.actual.tolist()):
+                current[name] = (table.groups[group], count)
+            n_changed = 0
+            for name, state in self.node_state.items():
+                if current.get(name) != state:
+                    self._remove(state[0], state[1], dirty)
+                    n_changed += name not in current
+            for name, state in current.items():
+                if self.node_state.get(name) != state:
+                    self._add(state[0], state[1], dirty)
+                    n_changed += 1
+            self.node_state = current
+
+        for feature in dirty:
+            if feature in self.histograms:
+                self.modes[feature] = group_mode(self.histograms[feature])
+            else:
+                self.modes.pop(feature, None)
+
+        self._last_table = table
+        return n_changed
+
+    def group_expected(self, groups):
+        """Expected counts aligned with a ScanTable's `groups` list."""
+        return np.array([self.modes[feature] for feature in groups], dtype=np.int32)
+
 # --- DATA GATHERING ---
 
 def get_slurm_data():
-    """Runs 'scontrol show node' once."""
-    try:
+    """The whole output of 'scontrol show node' as one string (see stream_slurm_data())."""
+    return "".join(stream_slurm_data())
+
+def stream_slurm_data(cmd=None):
+    """
+    Runs 'scontrol show node' and yields its output line by line as it
+    arrives, so the full text is never held in memory at once.
+    """
+    if cmd is None:
         cmd = ["scontrol", "show", "node"]
-        result = subprocess.check_output(cmd, encoding='utf-8', stderr=subprocess.DEVNULL)
-        return result
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                encoding='utf-8')
     except Exception as e:
         print(f"Error running scontrol: {e}")
-        return ""
+        return
 
-def parse_nodes(raw_output):
-    """Parses raw output into structured data."""
-    nodes = []
-    raw_blocks = raw_output.split("NodeName=")
-    
-    for block in raw_blocks:
-        if not block.strip(): continue
-        node_name = block.split()[0]
-        
-        # Extract raw features string for grouping logic
-        feat_match = re.search(r"AvailableFeatures=([^\s]+)", block)
-        raw_features = feat_match.group(1) if feat_match else "Unknown"
-        
-        # Extract pretty model name for display
-        model_display_name = extract_model_name(raw_features)
-        
-        # Extract GPU Count
-        gres_match = re.search(r"Gres=.*gpu:.*?:?(\d+)", block)
-        if gres_match:
-            gpu_count = int(gres_match.group(1))
-        else:
-            simple_match = re.search(r"Gres=gpu:(\d+)", block)
-            gpu_count = int(simple_match.group(1)) if simple_match else 0
-
-        if gpu_count > 0:
-            nodes.append({
-                "name": node_name,
-                "raw_features": raw_features,
-                "model_name": model_display_name,
-                "gpu_count": gpu_count
-            })
-            
-    return nodes
+    with proc:
+        yield from proc.stdout
+
+    if proc.returncode != 0:
+        print(f"Error running scontrol: exited with status {proc.returncode}")
+
+def iter_node_blocks(lines):
+    """
+    Groups an iterable of scontrol output lines into one text block per node.
+    Each block starts right after "NodeName=", so its first token is the name.
+    """
+    block = []
+    for line in lines:
+        stripped = line.lstrip()
+        if stripped.startswith("NodeName="):
+            if block:
+                yield "".join(block)
+            block = [stripped[len("NodeName="):]]
+        elif block:
+            block.append(line)
+    if block:
+        yield "".join(block)
+
+_VALUE = re.compile(r"\S*")
+
+def node_field(block, key, default=''):
+    """
+    The value of one "Key=value" token of a node block, up to the next
+    whitespace, or `default`. The key is located with str.find, so a lookup
+    costs far less than tokenizing the whole block when only a few fields
+    are needed.
+    """
+    for sep in (' ', '\n'):
+        start = block.find(f"{sep}{key}=")
+        if start >= 0:
+            return _VALUE.match(block, start + len(key) + 2).group()
+    return default
+
+def gres_gpu_count(gres):
+    """
+    Total GPUs in a Gres string, e.g. "gpu:rtx_2080ti:8(S:0-1)" -> 8 or
+    "gpu:a100:2,gpu:1" -> 3. Socket/index annotations in parentheses are ignored.
+    """
+    total = 0
+    for entry in re.sub(r"\([^)]*\)", "", gres).split(','):
+        parts = entry.split(':')
+        if parts[0] == 'gpu' and len(parts) > 1 and parts[-1].isdigit():
+            total += int(parts[-1])
+    return total
+
+def tres_gpu_count(tres):
+    """GPU count from a TRES string, e.g. "cpu=48,mem=380000M,gres/gpu=8" -> 8."""
+    for item in tres.split(','):
+        k, _, v = item.partition('=')
+        if k == 'gres/gpu' and v.isdigit():
+            return int(v)
+    return 0
+
+def parse_node_block(block):
+    """Parses a single node block. Returns None for nodes without GPUs."""
+    # Blocks start right after "NodeName=", so the first token is the name
+    node_name = _VALUE.match(block).group()
+    if not node_name: return None
+
+    # GPU count from Gres, falling back to the configured TRES
+    gpu_count = gres_gpu_count(node_field(block, 'Gres'))
+    if gpu_count == 0:
+        gpu_count = tres_gpu_count(node_field(block, 'CfgTRES'))
+
+    if gpu_count <= 0:
+        return None
+
+    # Raw features string for grouping logic
+    raw_features = node_field(block, 'AvailableFeatures') or "Unknown"
+
+    return NodeRecord(node_name, raw_features, extract_model_name(raw_features), gpu_count,
+                      state=node_field(block, 'State'), partitions=node_field(block, 'Partitions'))
+
+def iter_nodes(lines):
+    """Streaming parser: yields one GPU node record per block as lines arrive."""
+    for block in iter_node_blocks(lines):
+        node = parse_node_block(block)
+        if node is not None:
+            yield node
+
+def parse_nodes(raw_output, columnar=False):
+    """
+    Parses raw output into structured data: a list of NodeRecords, or a
+    ScanTable if columnar=True.
+    """
+    nodes = iter_nodes(io.StringIO(raw_output))
+    if columnar:
+        return ScanTable(nodes)
+    return list(nodes)
 
 # --- VISUALIZATION (NEW SLOT LOGIC) ---
 
-def save_cluster_image(nodes, expected_counts):
+RENDER_STATE_FILE = os.path.join("images", ".last_render")
+
+def read_render_state():
+    """(state hash, filename) of the last rendered snapshot, or (None, None)."""
+    try:
+        with open(RENDER_STATE_FILE) as f:
+            state, filename = f.read().split(None, 1)
+        return state, filename.strip()
+    except (OSError, ValueError):
+        return None, None
+
+def write_render_state(state, filename):
+    with open(RENDER_STATE_FILE, 'w') as f:
+        f.write(f"{state} {filename}\n")
+
+# --- SCAN STATES ---
+# Every classified scan is also kept as a few KB of arrays, so the history
+# animation can be drawn from the data instead of decoding PNGs. Names,
+# models and expected counts are stored once per topology; each scan adds
+# only its GPU counts, statuses, partitions and node states.
+
+STATES_DIR = os.path.join("images", "states")
+
+def state_filename(directory, timestamp):
+    return os.path.join(directory, f"status_{timestamp.strftime('%Y%m%d_%H%M%S')}.npz")
+
+def topology_key(arrays):
+    """Hash of the ScanTable.TOPOLOGY arrays, naming their shared file."""
+    digest = hashlib.sha1()
+    for name in ScanTable.TOPOLOGY:
+        digest.update(name.encode())
+        digest.update(arrays[name].tobytes())
+    return digest.hexdigest()
+
+def _save_arrays(path, arrays):
+    partial = path + ".partial"
+    with open(partial, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(partial, path)
+
+def save_scan_state(table, directory=STATES_DIR):
+    """Stores a classified ScanTable under `directory`. Returns the path, or None on failure."""
+    arrays = table.to_arrays()
+    key = topology_key(arrays)
+    topology_path = os.path.join(directory, f"topology_{key}.npz")
+    path = state_filename(directory, table.timestamp)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(topology_path):
+            _save_arrays(topology_path, {name: arrays[name] for name in ScanTable.TOPOLOGY})
+        scan = {name: value for name, value in arrays.items() if name not in ScanTable.TOPOLOGY}
+        _save_arrays(path, dict(scan, topology=np.array(key)))
+    except OSError as e:
+        print(f"Could not save scan state in {directory}: {e}")
+        return None
+    return path
+
+def load_scan_state(path, topologies=None):
+    """
+    The ScanTable stored at `path` by save_scan_state(). Pass the same dict
+    as `topologies` when loading many scans, so each topology file is only
+    read once.
+    """
+    if topologies is None:
+        topologies = {}
+    with np.load(path) as scan:
+        arrays = dict(scan)
+    key = str(arrays.pop('topology'))
+    if key not in topologies:
+        with np.load(os.path.join(os.path.dirname(path), f"topology_{key}.npz")) as topology:
+            topologies[key] = dict(topology)
+    arrays.update(topologies[key])
+    return ScanTable.from_arrays(arrays)
+
+def save_cluster_image(table, unchanged='skip', renderer='matplotlib', reuse_figure=False,
+                       tile_by=None, tile_size=None, views=(), workers=1):
+    """
+    Draws the chassis/LED grid for a classified ScanTable and saves it as a PNG.
+    If nothing shown in the image changed since the last snapshot, `unchanged`
+    decides what happens: 'skip' writes nothing, 'link' hard-links the previous
+    PNG under the new name, 'render' draws it anyway. `renderer` picks the
+    backend: 'matplotlib', 'raster' (Pillow, no matplotlib needed) or 'svg'
+    (vector output, written as .svg instead of .png). `reuse_figure` keeps
+    the matplotlib figure for the next call.
+    With `tile_by` ('count', 'model' or 'partition') the scan is split into
+    pages of at most `tile_size` nodes under images/tiles/, see tile_rows().
+    `views` adds extra images under images/views/, see view_jobs(). With
+    several images and workers > 1 they are rendered in a process pool.
+    Returns the image (or tile index) path, or None if skipped.
+    """
     if not os.path.exists("images"):
         os.makedirs("images")
 
-    nodes.sort(key=lambda x: x['name'])
+    stamp = table.timestamp.strftime('%Y%m%d_%H%M%S')
+    ext = IMAGE_EXTENSIONS.get(renderer, 'png')
+    state = f"{table.state_hash()}:{ext}"  # a PNG is no stand-in for an SVG
+    if tile_by:
+        tile_size = tile_size or TILE_SIZE
+        filename = os.path.join(TILES_DIR, f"status_{stamp}", "index.html")
+        state += f":{tile_by}:{tile_size}"
+    else:
+        filename = f"images/status_{stamp}.{ext}"
+    if views:
+        state += ":" + ",".join(views)
+    if tile_by == 'partition' or 'partition' in views:
+        state += ":" + table.partition_hash()  # pages or views grouped by partition
+
+    last_state, last_filename = read_render_state()
+    if (unchanged != 'render' and state == last_state
+            and last_filename and os.path.exists(last_filename)):
+        if unchanged == 'skip':
+            print(f"Cluster unchanged since {last_filename}, skipping snapshot.")
+            return None
+        try:
+            if filename != last_filename:
+                link_snapshot(last_filename, filename)
+                if views:
+                    link_directory(views_dir(last_filename), views_dir(filename))
+            print(f"Cluster unchanged, linked snapshot: {filename} -> {last_filename}")
+            return filename
+        except OSError as e:
+            print(f"Could not link {last_filename} ({e}), rendering instead.")
+
+    if tile_by:
+        jobs = tile_jobs(table, os.path.dirname(filename), tile_by, tile_size, ext)
+    else:
+        jobs = [('full', table, filename, None)]
+    if views:
+        jobs += view_jobs(table, views, views_dir(filename), ext)
+
+    render_times = run_render_jobs(jobs, renderer, workers, reuse_figure)
+    if tile_by:
+        write_tile_index(filename, table, jobs)
+    if len(jobs) > 1:
+        for (name, _, path, _), seconds in zip(jobs, render_times):
+            print(f"  {name:<32} {seconds:7.2f}s  {path}")
+
+    write_render_state(state, filename)
+    print(f"Snapshot saved to: {filename}")
+    return filename
+
+def link_snapshot(last_filename, filename):
+    """Hard-links a previous snapshot (or every file of a tile directory) under a new name."""
+    if os.path.basename(filename) != "index.html":
+        os.link(last_filename, filename)
+    else:
+        link_directory(os.path.dirname(last_filename), os.path.dirname(filename))
+
+def link_directory(source, target):
+    """Hard-links every file of `source` into a new directory `target`."""
+    os.makedirs(target, exist_ok=True)
+    for name in os.listdir(source):
+        os.link(os.path.join(source, name), os.path.join(target, name))
+
+# File extension per renderer backend, where it isn't png
+IMAGE_EXTENSIONS = {'svg': 'svg'}
+
+def draw_snapshot(table, geometry, filename, renderer='matplotlib', reuse_figure=False, title=None):
+    """Renders one image with the chosen backend."""
+    if renderer == 'raster':
+        import render_raster
+        render_raster.draw_cluster(table, geometry, filename, title)
+    elif renderer == 'svg':
+        import render_svg
+        render_svg.draw_cluster(table, geometry, filename, title)
+    else:
+        draw_cluster_matplotlib(table, geometry, filename, reuse_figure, title)
+
+# --- RENDER JOBS ---
+# Tiled pages and extra views are independent images, described as
+# (name, ScanTable, filename, title) jobs. A pool worker only receives the
+# pickled table slice it draws, a few KB per hundred nodes.
+
+def render_job(name, table, filename, title=None, renderer='matplotlib', reuse_figure=False):
+    """Renders one job and returns the seconds it took. Runs in pool workers too."""
+    start = time.perf_counter()
+    # Only the full snapshot keeps its layout cached; slices are cheap to lay out
+    geometry = layout.cached_layout(table.expected) if name == 'full' else layout.ClusterLayout(table.expected)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    draw_snapshot(table, geometry, filename, renderer, reuse_figure and name == 'full', title)
+    return time.perf_counter() - start
+
+def run_render_jobs(jobs, renderer='matplotlib', workers=1, reuse_figure=False):
+    """
+    Renders every job, in a ProcessPoolExecutor of up to `workers` processes
+    when there is more than one job, else in this process (where the full
+    snapshot can reuse its figure). Returns the seconds each job took.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [render_job(name, part, filename, title, renderer, reuse_figure)
+                for name, part, filename, title in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+    if renderer == 'matplotlib':
+        # Import it once here so forked workers inherit it instead of each importing it
+        import matplotlib.backends.backend_agg
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [pool.submit(render_job, name, part, filename, title, renderer)
+                   for name, part, filename, title in jobs]
+        return [future.result() for future in futures]
+
+# --- TILED RENDERING ---
+# A single image grows by one 200px row per 5 nodes, so a few thousand nodes
+# make a canvas of several hundred MB. Tiled mode renders fixed-size pages
+# instead, which bounds peak memory at one page per process.
+
+TILE_SIZE = 100  # nodes per page
+TILES_DIR = os.path.join("images", "tiles")
+
+def tile_rows(table, tile_by='count', tile_size=TILE_SIZE):
+    """
+    Splits a ScanTable into [(label, row indices)] pages of at most
+    `tile_size` nodes: in node order ('count'), per GPU model ('model'), or
+    per Slurm partition ('partition'; nodes in several partitions appear
+    on each of their pages).
+    """
+    buckets = defaultdict(list)
+    if tile_by == 'model':
+        for row, model in enumerate(table.model_names()):
+            buckets[model].append(row)
+    elif tile_by == 'partition':
+        for row, partition in enumerate(table.partition_id.tolist()):
+            for name in table.partitions[partition].split(','):
+                buckets[name or "(no partition)"].append(row)
+    else:
+        buckets[""] = list(range(len(table)))
+
+    tiles = []
+    for key in sorted(buckets):
+        rows = np.asarray(buckets[key], dtype=np.int64)
+        pages = max(1, -(-len(rows) // tile_size))
+        for page in range(pages):
+            label = f"{key} {page + 1}/{pages}".strip() if pages > 1 else key
+            tiles.append((label, rows[page * tile_size:(page + 1) * tile_size]))
+    return tiles
+
+def tile_jobs(table, directory, tile_by='count', tile_size=TILE_SIZE, ext='png'):
+    """Render jobs for every page from tile_rows(), as tile_NNN.<ext> in `directory`."""
+    jobs = []
+    for number, (label, rows) in enumerate(tile_rows(table, tile_by, tile_size), 1):
+        jobs.append((f"tile {label or number}", table.take(rows),
+                     os.path.join(directory, f"tile_{number:03d}.{ext}"),
+                     layout.title_text(table.timestamp, label)))
+    return jobs
+
+# --- EXTRA VIEWS ---
+
+VIEWS = ('partition', 'model', 'degraded')
+VIEWS_DIR = os.path.join("images", "views")
+
+def views_dir(filename):
+    """Directory for the extra views of the snapshot saved as `filename`."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if stem == "index":
+        stem = os.path.basename(os.path.dirname(filename))
+    return os.path.join(VIEWS_DIR, stem)
+
+def view_jobs(table, views, directory, ext='png'):
+    """
+    Render jobs for extra views of a scan, saved in `directory`: one image
+    per partition ('partition'), per GPU model ('model'), and/or one of the
+    degraded nodes only ('degraded').
+    """
+    jobs = []
+    for view in views:
+        if view == 'degraded':
+            groups = [("degraded", np.flatnonzero(table.status == STATUS_DEGRADED))]
+        else:
+            groups = tile_rows(table, view, max(1, len(table)))
+        for label, rows in groups:
+            slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)
+            filename = f"{view}.{ext}" if slug == view else f"{view}_{slug}.{ext}"
+            jobs.append((f"{view} {label}" if label != view else view, table.take(rows),
+                         os.path.join(directory, filename), layout.title_text(table.timestamp, label)))
+    return jobs
+
+def write_tile_index(path, table, jobs):
+    """The HTML page stitching a scan's tiles (from tile_jobs()) together."""
+    entries = [(os.path.basename(filename), name[len("tile "):], len(tile),
+                int(np.count_nonzero(tile.status == STATUS_DEGRADED)))
+               for name, tile, filename, _ in jobs]
+    title = html.escape(layout.title_text(table.timestamp))
+    links = "\n".join(
+        f'<li><a href="#{name}">{html.escape(label or name)}</a>: {count} nodes, {degraded} degraded</li>'
+        for name, label, count, degraded in entries)
+    images = "\n".join(
+        f'<img id="{name}" src="{name}" alt="{html.escape(label or name)}" loading="lazy">'
+        for name, label, _, _ in entries)
+    with open(path, 'w') as f:
+        f.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; color: {layout.C_TEXT}; }}
+img {{ display: block; max-width: 100%; margin-bottom: 1em; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<ul>
+{links}
+</ul>
+{images}
+</body>
+</html>
+""")
+
+# The figure of the last matplotlib render, kept by resident processes so
+# that later scans with the same topology only repaint what changed.
+_figure_cache = {}
+
+def _build_cluster_figure(table, geometry):
+    """
+    Builds the matplotlib figure for a topology and rasterizes its static
+    part (chassis and labels) once. The LEDs and the title are "animated"
+    artists, drawn separately on top of the saved background each scan.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import PatchCollection, PolyCollection
+    import matplotlib.patches as patches
+
+    fig = Figure(figsize=(geometry.width_px / layout.DPI, geometry.height_px / layout.DPI),
+                 dpi=layout.DPI)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes(geometry.figure_axes_rect())
 
-    # Grid Setup
-    cols = 5
-    rows = math.ceil(len(nodes) / cols)
-    
-    fig_height = max(6, rows * 2.0)
-    fig, ax = plt.subplots(figsize=(14, fig_height))
-    
     # Canvas coordinate space
-    ax.set_xlim(0, cols * 3.0)
-    ax.set_ylim(0, rows * 2.5)
+    ax.set_xlim(*geometry.xlim)
+    ax.set_ylim(*geometry.ylim)
     ax.axis('off')
 
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ax.set_title(f"Cluster GPU Slots - {timestamp}", fontsize=16, fontweight='bold', y=0.99)
-
-    # Node Container Dimensions
-    node_w = 2.6
-    node_h = 2.0
-    spacing_x = 0.4
-    spacing_y = 0.5
-    start_x = 0.2
-    start_y = (rows * 2.5) - 2.2
-
-    # Colors
-    c_node_bg = '#e0e0e0' # Light grey chassis
-    c_node_border = '#777777'
-    c_led_ok = '#2ecc71'   # Nice green
-    c_led_miss = '#e74c3c' # Nice red
-    c_text = '#2c3e50'
-
-    for i, node in enumerate(nodes):
-        curr_row = i // cols
-        curr_col = i % cols
-        
-        # Node container position (bottom-left corner)
-        nx = start_x + (curr_col * (node_w + spacing_x))
-        ny = start_y - (curr_row * (node_h + spacing_y))
-
-        # 1. Draw Node Chassis Container
-        chassis = patches.FancyBboxPatch((nx, ny), node_w, node_h, 
-                                       boxstyle="round,pad=0.1", 
-                                       linewidth=1.5, edgecolor=c_node_border, facecolor=c_node_bg)
-        ax.add_patch(chassis)
-
-        # Node Name & Model Text
-        ax.text(nx + node_w/2, ny + node_h - 0.3, node['name'], 
-                ha='center', fontsize=11, fontweight='bold', color=c_text)
-        ax.text(nx + node_w/2, ny + node_h - 0.6, node['model_name'], 
-                ha='center', fontsize=9, fontstyle='italic', color=c_text)
-
-        # 2. Draw GPU Slots (LEDs) inside the chassis
-        actual = node['gpu_count']
-        expected = expected_counts[node['raw_features']]
-        
-        # LED Layout definition
-        led_rows = 2
-        led_cols = math.ceil(expected / led_rows)
-        led_w = 0.4
-        led_h = 0.3
-        led_pad_x = 0.1
-        led_pad_y = 0.15
-        
-        # Start position for LEDs (bottom left inside chassis)
-        led_start_x = nx + (node_w - (led_cols*(led_w+led_pad_x)))/2 + led_pad_x/2
-        led_start_y = ny + 0.3
-
-        slot_idx = 0
-        for lr in range(led_rows -1, -1, -1): # Bottom row first
-            for lc in range(led_cols):
-                if slot_idx >= expected: break # Don't draw extra slots if expected is odd number
-
-                lx = led_start_x + (lc * (led_w + led_pad_x))
-                ly = led_start_y + (lr * (led_h + led_pad_y))
-                
-                # Color logic: Green if present, Red if missing slot
-                if slot_idx < actual:
-                    led_color = c_led_ok
-                    edge_color = '#27ae60'
-                else:
-                    led_color = c_led_miss
-                    edge_color = '#c0392b'
-
-                # Draw LED rect
-                led = patches.Rectangle((lx, ly), led_w, led_h, linewidth=1, 
-                                      edgecolor=edge_color, facecolor=led_color)
-                ax.add_patch(led)
-                slot_idx += 1
-
-    # Save File
-    filename = f"images/status_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-    plt.tight_layout()
-    plt.savefig(filename, dpi=100)
-    plt.close()
-    print(f"Snapshot saved to: {filename}")
+    title = fig.text(0.5, 1 - layout.TITLE_BASELINE_PX / geometry.height_px, "",
+                     ha='center', va='baseline', fontsize=layout.TITLE_FONTSIZE, fontweight='bold',
+                     animated=True)
+
+    # 1. Draw Node Chassis Containers as one collection
+    node_x = geometry.node_x.tolist()
+    node_y = geometry.node_y.tolist()
+    chassis = [patches.FancyBboxPatch((nx, ny), layout.NODE_W, layout.NODE_H,
+                                      boxstyle=f"round,pad={layout.NODE_PAD}")
+               for nx, ny in zip(node_x, node_y)]
+    ax.add_collection(PatchCollection(chassis, facecolor=layout.C_NODE_BG, edgecolor=layout.C_NODE_BORDER,
+                                      linewidth=layout.CHASSIS_LINEWIDTH), autolim=False)
+
+    # Node Name & Model Text
+    for nx, ny, name, model in zip(node_x, node_y, table.names, table.model_names()):
+        ax.text(nx + layout.NODE_W/2, ny + layout.NODE_H - 0.3, name, 
+                ha='center', fontsize=layout.NAME_FONTSIZE, fontweight='bold', color=layout.C_TEXT)
+        ax.text(nx + layout.NODE_W/2, ny + layout.NODE_H - 0.6, model, 
+                ha='center', fontsize=layout.MODEL_FONTSIZE, fontstyle='italic', color=layout.C_TEXT)
+
+    # 2. GPU Slots (LEDs) as one collection of rectangles, colored per scan
+    x0, y0 = geometry.led_x, geometry.led_y
+    x1, y1 = x0 + layout.LED_W, y0 + layout.LED_H
+    led_verts = np.stack([np.stack([x0, y0], axis=1), np.stack([x1, y0], axis=1),
+                          np.stack([x1, y1], axis=1), np.stack([x0, y1], axis=1)], axis=1)
+    leds = PolyCollection(led_verts, linewidths=layout.LED_LINEWIDTH, animated=True)
+    ax.add_collection(leds, autolim=False)
+
+    canvas.draw()
+    return {'fig': fig, 'ax': ax, 'title': title, 'leds': leds,
+            'background': canvas.copy_from_bbox(fig.bbox)}
+
+def draw_cluster_matplotlib(table, geometry, filename, reuse=False, title=None):
+    """
+    Draws the cluster image for a ScanTable/ClusterLayout pair with matplotlib,
+    titled `title` (default: the scan time).
+    With reuse=True the figure is kept, and as long as the topology (nodes,
+    models, expected counts) stays the same, later calls only recolor the
+    LEDs and retitle before drawing them over the cached background.
+    """
+    from matplotlib.colors import to_rgba
+    from PIL import Image
+
+    key = table.topology_hash()
+    if reuse and _figure_cache.get('key') == key:
+        cached = _figure_cache
+    else:
+        cached = _build_cluster_figure(table, geometry)
+        if reuse:
+            _figure_cache.clear()
+            _figure_cache.update(cached, key=key)
+    fig = cached['fig']
+    title_artist = cached['title']
+    leds = cached['leds']
+
+    # Green if present, Red if missing slot
+    present = geometry.slot_present(table.actual).astype(int)
+    leds.set_facecolor(np.array([to_rgba(layout.C_LED_MISS), to_rgba(layout.C_LED_OK)])[present])
+    leds.set_edgecolor(np.array([to_rgba(layout.C_LED_MISS_EDGE), to_rgba(layout.C_LED_OK_EDGE)])[present])
+    title_artist.set_text(title or layout.title_text(table.timestamp))
+
+    fig.canvas.restore_region(cached['background'])
+    cached['ax'].draw_artist(leds)
+    fig.draw_artist(title_artist)
+
+    # Save File straight from the Agg buffer; savefig would redraw everything
+    Image.fromarray(np.asarray(fig.canvas.buffer_rgba())).save(filename)
 
 # --- MAIN LOGIC ---
 
-def generate_report():
+def generate_report(timings=None, histograms=None, baseline=None, store=None,
+                    unchanged='skip', renderer='matplotlib', reuse_figure=False,
+                    tile_by=None, tile_size=None, views=(), workers=1, states_dir=STATES_DIR):
+    """
+    Runs one full scan. If a dict is passed as `timings`, the wall time of
+    each phase (gather, report, render) is recorded into it in seconds.
+    A GroupHistograms passed as `histograms` is updated incrementally and
+    used for the peer comparison instead of relearning from scratch.
+    With a history.ExpectedBaseline, nodes are classified against the
+    long-term baseline, and the scan is then added to it. A
+    history.ScanHistory passed as `store` gets every classified scan appended.
+    `unchanged`, `renderer`, `reuse_figure`, `tile_by`, `tile_size`, `views`
+    and `workers` are passed on to save_cluster_image(); renderer=None skips
+    the image entirely. Unless `states_dir` is None, the classified scan is
+    also stored there for make_gif.py --from-states. The files written are
+    recorded in the snapshot manifest (see manifest.py).
+    """
+    if timings is None:
+        timings = {}
+
     print("Gathering cluster status via scontrol...")
-    raw_data = get_slurm_data()
-    nodes = parse_nodes(raw_data)
+    # Nodes are parsed while scontrol is still writing, so gather and parse
+    # are a single phase.
+    t0 = time.perf_counter()
+    nodes = ClusterScan(iter_nodes(stream_slurm_data()))
+    timings['gather'] = time.perf_counter() - t0
     
     if not nodes:
         print("No GPU nodes found.")
         return
 
+    t0 = time.perf_counter()
+
     # Learning Phase (Peer Comparison on raw feature strings)
-    feature_groups = defaultdict(list)
-    for node in nodes:
-        feature_groups[node['raw_features']].append(node['gpu_count'])
-    
-    expected_counts = {}
-    for feature, counts in feature_groups.items():
-        if not counts: continue
-        mode = max(set(counts), key=counts.count)
-        expected_counts[feature] = mode
+    table = ScanTable(nodes)
+    if histograms is None:
+        group_expected = table.learn_expected()
+    else:
+        histograms.update(table)
+        group_expected = histograms.group_expected(table.groups)
+
+    if baseline is None:
+        table.classify(group_expected)
+    else:
+        table.classify(node_expected=baseline.node_expected(table, group_expected))
+        baseline.observe(table)
+
+    if store is not None:
+        store.record(table)
 
     # Text Report
     print(f"\n{'NODE':<12} {'STATUS':<12} {'MODEL':<20} {'SLOTS (ACT/EXP)'}")
     print("-" * 65)
-    nodes.sort(key=lambda x: x['name'])
-    for node in nodes:
-        actual = node['gpu_count']
-        expected = expected_counts[node['raw_features']]
-        
-        if actual < expected:
-            status = "\033[91mDEGRADED\033[0m"
-        elif actual > expected:
-            status = "\033[93mOVER\033[0m"
-        else:
-            status = "\033[92mOK\033[0m"
-            
+    rows = zip(table.names, table.model_names(), table.actual.tolist(),
+               table.expected.tolist(), table.status.tolist())
+    for name, model, actual, expected, status in rows:
         slots = f"{actual}/{expected}"
-        print(f"{node['name']:<12} {status:<21} {node['model_name']:<20} {slots:<15}")
+        print(f"{name:<12} {STATUS_LABELS[status]:<21} {model:<20} {slots:<15}")
+
+    timings['report'] = time.perf_counter() - t0
 
     # Image Generation
-    save_cluster_image(nodes, expected_counts)
+    if renderer is not None:
+        t0 = time.perf_counter()
+        state_path = save_scan_state(table, states_dir) if states_dir is not None else None
+        image_path = save_cluster_image(table, unchanged, renderer, reuse_figure, tile_by, tile_size, views, workers)
+        if image_path or state_path:
+            manifest.append("images", table.timestamp, table.state_hash(), image_path, state_path)
+        timings['render'] = time.perf_counter() - t0
+
+# --- DAEMON MODE ---
+
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+
+def _handle_stop(signum, frame):
+    print(f"Received signal {signum}, stopping after the current scan...")
+    _stop_event.set()
+    _wake_event.set()
+
+def _handle_hup(signum, frame):
+    print("Received SIGHUP, rescanning now...")
+    _wake_event.set()
+
+def format_timings(scan_number, timings):
+    """One-line summary of a scan's phase timings for the log."""
+    phases = ['gather', 'report', 'render']
+    parts = [f"{p}={timings[p]:.3f}s" for p in phases if p in timings]
+    total = sum(timings.get(p, 0.0) for p in phases)
+    return f"Scan #{scan_number} timings: {' '.join(parts)} total={total:.3f}s"
+
+def run_daemon(interval, **report_options):
+    """
+    Keeps the process resident and rescans every `interval` seconds.
+    Imports and caches (e.g. model name lookups) stay warm between scans.
+    SIGTERM/SIGINT finish the current scan and exit; SIGHUP forces a rescan.
+    `report_options` are passed to every generate_report() call; the
+    matplotlib figure is kept between scans unless they say otherwise.
+    """
+    report_options.setdefault('reuse_figure', True)
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, _handle_hup)
+
+    print(f"Daemon mode: scanning every {interval}s "
+          f"(startup imports took {IMPORT_SECONDS:.3f}s, paid once)")
+
+    histograms = GroupHistograms()
+    scan_number = 0
+    while not _stop_event.is_set():
+        scan_number += 1
+        scan_start = time.perf_counter()
+        timings = {}
+        try:
+            generate_report(timings, histograms, **report_options)
+        except Exception as e:
+            print(f"Scan #{scan_number} failed: {e}")
+        print(format_timings(scan_number, timings))
+        sys.stdout.flush()
+
+        elapsed = time.perf_counter() - scan_start
+        _wake_event.wait(max(0.0, interval - elapsed))
+        _wake_event.clear()
+
+    print("Daemon stopped.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="GPU cluster health monitor")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Stay resident and rescan on a schedule instead of exiting")
+    parser.add_argument('--interval', type=float, default=300,
+                        help="Seconds between scans in daemon mode (default: 300)")
+    parser.add_argument('--history-db', default=history.DEFAULT_DB,
+                        help=f"SQLite file for scan history and baselines (default: {history.DEFAULT_DB})")
+    parser.add_argument('--no-baseline', action='store_true',
+                        help="Compare against this scan's peers only, ignoring the stored baseline")
+    parser.add_argument('--no-history', action='store_true',
+                        help="Don't append this scan to the history database")
+    parser.add_argument('--unchanged', choices=['skip', 'link', 'render'], default='skip',
+                        help="What to do when no node changed since the last snapshot: "
+                             "write nothing (default), hard-link the previous PNG, or render anyway")
+    parser.add_argument('--renderer', choices=['matplotlib', 'raster', 'svg'], default='matplotlib',
+                        help="Image backend: matplotlib (default), raster (Pillow, much faster) "
+                             "or svg (vector .svg files, fastest and smallest)")
+    parser.add_argument('--no-image', action='store_true',
+                        help="Text report only: no snapshot, and no plotting libraries loaded")
+    parser.add_argument('--tile-by', choices=['count', 'model', 'partition'],
+                        help="Split the snapshot into pages (in node order, per GPU model or per "
+                             "partition) under images/tiles/, with an index.html; for large clusters")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE,
+                        help=f"Nodes per page with --tile-by (default: {TILE_SIZE})")
+    parser.add_argument('--view', dest='views', action='append', choices=VIEWS, default=[],
+                        help="Also render this view under images/views/ (repeatable): one image per "
+                             "partition, one per GPU model, or the degraded nodes only")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes rendering pages/views in parallel (default: 1; a pool only "
+                             "pays off with several idle cores)")
+    parser.add_argument('--no-states', action='store_true',
+                        help=f"Don't store the classified scan under {STATES_DIR} "
+                             "(what make_gif.py --from-states animates)")
+    parser.add_argument('--baseline-half-life', type=float, default=history.DEFAULT_HALF_LIFE_DAYS,
+                        help="Days of scan time after which an observation counts half in the stored "
+                             f"baseline, however often scans run (default: {history.DEFAULT_HALF_LIFE_DAYS:g})")
+    args = parser.parse_args(argv)
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.tile_size < 1:
+        parser.error("--tile-size must be at least 1")
+    if not args.baseline_half_life > 0:
+        parser.error("--baseline-half-life must be positive")
+    return args
 
 if __name__ == "__main__":
-    generate_report()
+    args = parse_args()
+    baseline = None
+    store = None
+    if not (args.no_baseline and args.no_history):
+        conn = history.connect(args.history_db)
+        if not args.no_baseline:
+            baseline = history.ExpectedBaseline(conn, half_life_days=args.baseline_half_life)
+        if not args.no_history:
+            store = history.ScanHistory(conn)
+    report_options = dict(baseline=baseline, store=store, unchanged=args.unchanged,
+                          renderer=None if args.no_image else args.renderer,
+                          tile_by=args.tile_by, tile_size=args.tile_size,
+                          views=tuple(dict.fromkeys(args.views)), workers=args.workers,
+                          states_dir=None if args.no_states else STATES_DIR)
+    if args.daemon:
+        run_daemon(args.interval, **report_options)
+    else:
+        timings = {}
+        generate_report(timings, **report_options)
+        print(f"Startup imports took {IMPORT_SECONDS:.3f}s")
+        print(format_timings(1, timings))
@@ -0,0 +1,308 @@
+import sqlite3
+import datetime
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+DEFAULT_DB = "gpu_history.db"
+
+# Stored weights grow by 2 every half-life instead of decaying every row.
+# Once the growth factor passes this, everything is rescaled back down.
+RESCALE_LIMIT = 1e12
+DEFAULT_HALF_LIFE_DAYS = 30.0
+
+def connect(path=DEFAULT_DB):
+    """Opens (creating if needed) the history database."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    return conn
+
+# --- EXPECTED-COUNT BASELINE ---
+
+class ExpectedBaseline:
+    """
+    Expected GPU counts learned over many scans, per feature group and per node.
+
+    Each key keeps a decayed histogram {gpu_count: weight}: every scan adds 1
+    for the count it saw, and older observations lose half their weight
+    every `half_life_days` of scan time (the gap between scan timestamps,
+    not the number of scans), so cron and daemon runs forget at the same
+    rate. A real hardware change is accepted after about a half-life, but a
+    whole group losing a GPU at once is not instantly the new normal. Decay
+    is applied lazily (new observations are scaled up instead), so a scan
+    only writes the rows it touched.
+    """
+
+    def __init__(self, conn, half_life_days=DEFAULT_HALF_LIFE_DAYS, min_weight=3.0):
+        if not half_life_days > 0:
+            raise ValueError("half_life_days must be positive")
+        self.conn = conn
+        self.half_life_days = half_life_days
+        self.min_weight = min_weight
+        self.weights = defaultdict(dict)  # (kind, key) -> {gpu_count: scaled weight}
+
+        conn.execute("""CREATE TABLE IF NOT EXISTS baseline (
+                            kind TEXT NOT NULL,
+                            key TEXT NOT NULL,
+                            gpu_count INTEGER NOT NULL,
+                            weight REAL NOT NULL,
+                            PRIMARY KEY (kind, key, gpu_count)
+                        ) WITHOUT ROWID""")
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key LIKE 'baseline_%'"))
+        # Stored weights are true weights at `origin`; `latest` is the newest scan seen
+        self.origin = self._time(meta.get('baseline_origin'))
+        self.latest = self._time(meta.get('baseline_latest'))
+        stored_half_life = float(meta.get('baseline_half_life', half_life_days))
+
+        for kind, key, count, weight in conn.execute("SELECT kind, key, gpu_count, weight FROM baseline"):
+            self.weights[(kind, key)][count] = weight
+
+        if 'baseline_epoch' in meta:
+            # Written when decay was per scan: fold it in once and switch over
+            self._scale_all(float(meta['baseline_decay']) ** int(meta['baseline_epoch']))
+            conn.execute("DELETE FROM meta WHERE key IN ('baseline_epoch', 'baseline_decay')")
+            self._save_meta()
+            conn.commit()
+        elif stored_half_life != half_life_days:
+            # Weights were scaled with the old half-life; bring them to `latest` first
+            self.half_life_days = stored_half_life
+            self._rescale()
+            self.half_life_days = half_life_days
+            self._save_meta()
+            conn.commit()
+
+    @staticmethod
+    def _time(text):
+        return datetime.datetime.fromisoformat(text) if text else None
+
+    def _growth(self, when):
+        """Multiplier from true weights at `origin` to weights at `when`."""
+        if self.origin is None or when is None:
+            return 1.0
+        days = (when - self.origin).total_seconds() / 86400
+        return 2.0 ** (days / self.half_life_days)
+
+    def _scale(self):
+        """Multiplier from stored to true weights, as of the latest scan."""
+        return 1.0 / self._growth(self.latest)
+
+    def _save_meta(self):
+        rows = [('baseline_half_life', repr(self.half_life_days))]
+        rows += [(key, value.isoformat(sep=' ')) for key, value in
+                 (('baseline_origin', self.origin), ('baseline_latest', self.latest)) if value is not None]
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", rows)
+
+    def _scale_all(self, scale):
+        for counts in self.weights.values():
+            for count in counts:
+                counts[count] *= scale
+        self.conn.execute("UPDATE baseline SET weight = weight * ?", (scale,))
+
+    def _rescale(self):
+        """Folds the pending decay into every stored weight and moves the origin to the latest scan."""
+        self._scale_all(self._scale())
+        self.origin = self.latest
+
+    def expected(self, kind, key):
+        """Baseline count for a 'group' or 'node' key, or None without enough history."""
+        counts = self.weights.get((kind, key))
+        if not counts or sum(counts.values()) * self._scale() < self.min_weight:
+            return None
+        # Heaviest count wins; ties go to the lowest count
+        return min(counts.items(), key=lambda item: (-item[1], item[0]))[0]
+
+    def node_expected(self, table, group_fallback):
+        """
+        Expected count for every row of a ScanTable. A node is expected to have
+        at least what its peer group normally has and at least what it has
+        normally had itself. Groups without history fall back to
+        `group_fallback` (per-group counts learned from the current scan).
+        """
+        group_expected = []
+        for group, fallback in zip(table.groups, np.asarray(group_fallback).tolist()):
+            baseline = self.expected('group', group)
+            group_expected.append(fallback if baseline is None else baseline)
+
+        expected = np.empty(len(table), dtype=np.int32)
+        for i, (name, group) in enumerate(zip(table.names, table.group_id.tolist())):
+            own = self.expected('node', name)
+            expected[i] = group_expected[group] if own is None else max(own, group_expected[group])
+        return expected
+
+    def observe(self, table):
+        """Adds one scan's counts to the baseline and persists the touched rows."""
+        if self.origin is None:
+            self.origin = table.timestamp
+        # A scan older than the latest one (a clock step back) counts as of the latest
+        self.latest = max(self.latest or table.timestamp, table.timestamp)
+        increment = self._growth(self.latest)
+
+        touched = set()
+        for name, group, count in zip(table.names, table.group_id.tolist(), table.actual.tolist()):
+            for key in (('node', name), ('group', table.groups[group])):
+                counts = self.weights[key]
+                counts[count] = counts.get(count, 0.0) + increment
+                touched.add((key, count))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO baseline (kind, key, gpu_count, weight) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (kind, key, gpu_count) DO UPDATE SET weight = excluded.weight",
+                [(kind, key, count, self.weights[(kind, key)][count])
+                 for (kind, key), count in touched])
+            if increment > RESCALE_LIMIT:
+                self._rescale()
+            self._save_meta()
+
+# --- SCAN HISTORY ---
+
+class ScanHistory:
+    """
+    Append-only log of every classified scan, one row per node per scan.
+    Rows are keyed by (node, time) and indexed by (group, time) and by time,
+    so per-node, per-group and time-window queries stay fast over months of
+    scans.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        with conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS scans (
+                                scanned_at TEXT PRIMARY KEY,
+                                node_count INTEGER NOT NULL,
+                                degraded INTEGER NOT NULL,
+                                over INTEGER NOT NULL
+                            )""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS node_scans (
+                                node TEXT NOT NULL,
+                                scanned_at TEXT NOT NULL,
+                                group_name TEXT NOT NULL,
+                                gpu_count INTEGER NOT NULL,
+                                expected INTEGER NOT NULL,
+                                status INTEGER NOT NULL,
+                                state TEXT NOT NULL,
+                                partitions TEXT NOT NULL,
+                                PRIMARY KEY (node, scanned_at)
+                            ) WITHOUT ROWID""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_node_scans_group_time "
+                         "ON node_scans (group_name, scanned_at)")
+            # Time-window queries over all nodes (slot_matrix)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_node_scans_time ON node_scans (scanned_at)")
+
+    def record(self, table):
+        """Appends a classified ScanTable in a single transaction."""
+        scanned_at = table.timestamp.isoformat(sep=' ')
+        # Status codes as in generate_gpu_status: 0 OK, 1 DEGRADED, 2 OVER
+        status_totals = np.bincount(table.status, minlength=3).tolist()
+        rows = zip(table.names,
+                   table.group_id.tolist(),
+                   table.actual.tolist(),
+                   table.expected.tolist(),
+                   table.status.tolist(),
+                   table.state_id.tolist(),
+                   table.partition_id.tolist())
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?)",
+                              (scanned_at, len(table), status_totals[1], status_totals[2]))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO node_scans VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(name, scanned_at, table.groups[group], count, expected, status,
+                  table.states[state], table.partitions[partition])
+                 for name, group, count, expected, status, state, partition in rows])
+
+    def _select(self, sql, conditions, params, since, until):
+        """Runs `sql` with the given WHERE conditions plus an optional time window."""
+        conditions = list(conditions)
+        params = list(params)
+        if since:
+            conditions.append("scanned_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("scanned_at < ?")
+            params.append(until)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self.conn.execute(sql + " ORDER BY scanned_at", params).fetchall()
+
+    def node_history(self, node, since=None, until=None):
+        """(scanned_at, node, gpu_count, expected, status) rows for one node, oldest first."""
+        return self._select("SELECT scanned_at, node, gpu_count, expected, status FROM node_scans",
+                            ["node = ?"], [node], since, until)
+
+    def group_history(self, group, since=None, until=None):
+        """The same rows for every node in a feature group, oldest first."""
+        return self._select("SELECT scanned_at, node, gpu_count, expected, status FROM node_scans",
+                            ["group_name = ?"], [group], since, until)
+
+    def node_changes(self, node, since=None, until=None):
+        """The scans where the node's GPU count differed from the scan before it."""
+        changes = []
+        previous = None
+        for row in self.node_history(node, since, until):
+            if previous is not None and row[2] != previous:
+                changes.append(row)
+            previous = row[2]
+        return changes
+
+    def scan_times(self, since=None, until=None):
+        """Timestamps of all recorded scans, oldest first."""
+        rows = self._select("SELECT scanned_at FROM scans", [], [], since, until)
+        return [row[0] for row in rows]
+
+    def slot_matrix(self, since=None, until=None):
+        """
+        The history as node x scan arrays: (scan times, node names sorted,
+        actual - expected GPUs, status). Status is -1 (and the difference 0)
+        where a node was not in a scan.
+        """
+        times = self.scan_times(since, until)
+        rows = self._select("SELECT scanned_at, node, gpu_count - expected, status FROM node_scans",
+                            [], [], since, until)
+        scanned_at, nodes, delta, status = zip(*rows) if rows else ((), (), (), ())
+        names = sorted(set(nodes))
+
+        # Rows to matrix cells through dictionary codes, then one scatter per column
+        time_index = {t: i for i, t in enumerate(times)}
+        node_index = {name: i for i, name in enumerate(names)}
+        cols = np.fromiter(map(time_index.__getitem__, scanned_at), dtype=np.int64, count=len(rows))
+        cells = np.fromiter(map(node_index.__getitem__, nodes), dtype=np.int64, count=len(rows))
+        cells = cells * len(times) + cols
+
+        delta_matrix = np.zeros(len(names) * len(times), dtype=np.int16)
+        status_matrix = np.full(len(names) * len(times), -1, dtype=np.int8)
+        delta_matrix[cells] = np.array(delta, dtype=np.int16)
+        status_matrix[cells] = np.array(status, dtype=np.int8)
+        shape = (len(names), len(times))
+        return times, names, delta_matrix.reshape(shape), status_matrix.reshape(shape)
+
+# --- COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the GPU scan history")
+    parser.add_argument('--db', default=DEFAULT_DB, help=f"History database (default: {DEFAULT_DB})")
+    parser.add_argument('--since', help="Only scans at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument('--until', help="Only scans before this time")
+    parser.add_argument('--all', action='store_true', help="List every scan, not just count changes")
+    parser.add_argument('kind', choices=['node', 'group'], help="Look up a node name or a feature group")
+    parser.add_argument('key', help="Node name, or raw AvailableFeatures string for a group")
+    args = parser.parse_args(argv)
+
+    store = ScanHistory(connect(args.db))
+    if args.kind == 'group':
+        rows = store.group_history(args.key, args.since, args.until)
+    elif args.all:
+        rows = store.node_history(args.key, args.since, args.until)
+    else:
+        rows = store.node_changes(args.key, args.since, args.until)
+
+    labels = {0: "OK", 1: "DEGRADED", 2: "OVER"}
+    print(f"{'TIME':<27} {'NODE':<12} {'STATUS':<10} {'SLOTS (ACT/EXP)'}")
+    for scanned_at, node, count, expected, status in rows:
+        print(f"{scanned_at:<27} {node:<12} {labels[status]:<10} {count}/{expected}")
+    if not rows:
+        print("No matching scans.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import hashlib
+
+import numpy as np
+
+# --- CANVAS & STYLE ---
+# Shared by every renderer backend so their output lines up pixel for pixel.
+
+DPI = 100
+CANVAS_WIDTH_PX = 1400
+MIN_CANVAS_HEIGHT_PX = 600
+ROW_HEIGHT_PX = 200
+
+MARGIN_PX = 15          # around the plot area on the left, right and bottom
+TITLE_BAND_PX = 36      # above the plot area
+TITLE_BASELINE_PX = 27  # from the top edge of the canvas
+
+# Fonts (points) as matplotlib specifies them
+TITLE_FONTSIZE = 16
+NAME_FONTSIZE = 11
+MODEL_FONTSIZE = 9
+
+# Grid
+COLS = 5
+CELL_W = 3.0
+CELL_H = 2.5
+
+# Node Container Dimensions
+NODE_W = 2.6
+NODE_H = 2.0
+NODE_PAD = 0.1   # FancyBboxPatch "round" padding, also the corner radius
+SPACING_X = 0.4
+SPACING_Y = 0.5
+START_X = 0.2
+
+# LED Layout definition
+LED_ROWS = 2
+LED_W = 0.4
+LED_H = 0.3
+LED_PAD_X = 0.1
+LED_PAD_Y = 0.15
+LED_OFFSET_Y = 0.3
+
+# Line widths (points)
+CHASSIS_LINEWIDTH = 1.5
+LED_LINEWIDTH = 1.0
+
+# Colors
+C_BACKGROUND = '#ffffff'
+C_NODE_BG = '#e0e0e0'  # Light grey chassis
+C_NODE_BORDER = '#777777'
+C_LED_OK = '#2ecc71'   # Nice green
+C_LED_OK_EDGE = '#27ae60'
+C_LED_MISS = '#e74c3c' # Nice red
+C_LED_MISS_EDGE = '#c0392b'
+C_TEXT = '#2c3e50'
+
+def points_to_pixels(points):
+    return points * DPI / 72.0
+
+# --- LAYOUT ---
+
+def canvas_size(n_nodes):
+    """(width, height) in pixels of the image of a cluster with n_nodes nodes."""
+    rows = max(1, -(-n_nodes // COLS))
+    return CANVAS_WIDTH_PX, max(MIN_CANVAS_HEIGHT_PX, rows * ROW_HEIGHT_PX)
+
+class ClusterLayout:
+    """
+    Geometry of the cluster image for one ScanTable: the canvas size, the
+    plot area, and the position of every chassis and GPU slot as NumPy arrays
+    in data coordinates (origin bottom-left, like matplotlib).
+
+    Slot arrays have one entry per expected GPU across the cluster;
+    slot_node[k] is the row of the node slot k belongs to and slot_index[k]
+    its position within that node.
+    """
+    __slots__ = ('cols', 'rows', 'width_px', 'height_px', 'xlim', 'ylim', 'plot_box',
+                 'node_x', 'node_y', 'slot_node', 'slot_index', 'led_x', 'led_y')
+
+    def __init__(self, expected):
+        expected = np.asarray(expected, dtype=np.int64)
+        n = len(expected)
+        node_id = np.arange(n)
+
+        # Grid Setup
+        self.cols = COLS
+        self.rows = max(1, -(-n // COLS))
+        self.width_px, self.height_px = canvas_size(n)
+        self.xlim = (0.0, self.cols * CELL_W)
+        self.ylim = (0.0, self.rows * CELL_H)
+        # (left, top, right, bottom) of the plot area in canvas pixels
+        self.plot_box = (MARGIN_PX, TITLE_BAND_PX,
+                         self.width_px - MARGIN_PX, self.height_px - MARGIN_PX)
+
+        # Node container positions (bottom-left corner)
+        start_y = self.ylim[1] - 2.2
+        self.node_x = START_X + (node_id % COLS) * (NODE_W + SPACING_X)
+        self.node_y = start_y - (node_id // COLS) * (NODE_H + SPACING_Y)
+
+        # Slots fill the top LED row first, then the bottom one
+        led_cols = (expected + LED_ROWS - 1) // LED_ROWS
+        self.slot_node = np.repeat(node_id, expected)
+        self.slot_index = np.arange(expected.sum()) - np.repeat(np.cumsum(expected) - expected, expected)
+        slot_cols = led_cols[self.slot_node]
+        self.led_x = (self.node_x[self.slot_node]
+                      + (NODE_W - slot_cols * (LED_W + LED_PAD_X)) / 2 + LED_PAD_X / 2
+                      + (self.slot_index % slot_cols) * (LED_W + LED_PAD_X))
+        self.led_y = (self.node_y[self.slot_node] + LED_OFFSET_Y
+                      + ((LED_ROWS - 1) - self.slot_index // slot_cols) * (LED_H + LED_PAD_Y))
+
+    def slot_present(self, actual):
+        """True for every slot the node actually has a GPU in."""
+        return self.slot_index < np.asarray(actual)[self.slot_node]
+
+    def scale(self):
+        """Pixels per data unit along x and y."""
+        left, top, right, bottom = self.plot_box
+        return ((right - left) / (self.xlim[1] - self.xlim[0]),
+                (bottom - top) / (self.ylim[1] - self.ylim[0]))
+
+    def to_pixels(self, x, y):
+        """Data coordinates -> canvas pixel coordinates (origin top-left)."""
+        left, top, right, bottom = self.plot_box
+        sx, sy = self.scale()
+        return (left + (np.asarray(x) - self.xlim[0]) * sx,
+                bottom - (np.asarray(y) - self.ylim[0]) * sy)
+
+    def chassis_pixel_boxes(self):
+        """(left, top, right, bottom) canvas pixels of every padded chassis, one row per node."""
+        left, top = self.to_pixels(self.node_x - NODE_PAD, self.node_y + NODE_H + NODE_PAD)
+        right, bottom = self.to_pixels(self.node_x + NODE_W + NODE_PAD, self.node_y - NODE_PAD)
+        return np.stack([left, top, right, bottom], axis=1)
+
+    def chassis_pixel_radius(self):
+        """Corner radius of the chassis boxes in pixels."""
+        sx, sy = self.scale()
+        return NODE_PAD * (sx + sy) / 2
+
+    def label_pixels(self):
+        """(center_x, name_y, model_y) canvas pixels of the text baselines of every node."""
+        center_x, name_y = self.to_pixels(self.node_x + NODE_W / 2, self.node_y + NODE_H - 0.3)
+        _, model_y = self.to_pixels(self.node_x, self.node_y + NODE_H - 0.6)
+        return center_x, name_y, model_y
+
+    def led_pixel_boxes(self):
+        """(left, top, right, bottom) canvas pixels of every GPU slot, one row per slot."""
+        left, top = self.to_pixels(self.led_x, self.led_y + LED_H)
+        right, bottom = self.to_pixels(self.led_x + LED_W, self.led_y)
+        return np.stack([left, top, right, bottom], axis=1)
+
+    def figure_axes_rect(self):
+        """The plot area as a matplotlib [left, bottom, width, height] figure fraction."""
+        left, top, right, bottom = self.plot_box
+        return [left / self.width_px, 1 - bottom / self.height_px,
+                (right - left) / self.width_px, (bottom - top) / self.height_px]
+
+# --- LAYOUT CACHE ---
+# A layout depends only on the expected count of each node (in node order)
+# and on the geometry constants above, so a resident process computes it
+# once per topology. Nothing is kept on disk: loading a saved layout took
+# longer than recomputing it.
+
+_GEOMETRY = (CANVAS_WIDTH_PX, MIN_CANVAS_HEIGHT_PX, ROW_HEIGHT_PX, MARGIN_PX, TITLE_BAND_PX,
+             COLS, CELL_W, CELL_H, NODE_W, NODE_H, SPACING_X, SPACING_Y, START_X,
+             LED_ROWS, LED_W, LED_H, LED_PAD_X, LED_PAD_Y, LED_OFFSET_Y)
+
+_loaded = {}  # the last layout handed out, for resident processes
+
+def topology_hash(expected):
+    """Cache key for the layout of `expected` under the current geometry constants."""
+    digest = hashlib.sha1(repr(_GEOMETRY).encode())
+    digest.update(np.asarray(expected, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def cached_layout(expected):
+    """ClusterLayout for `expected`, reused while the topology stays the same."""
+    key = topology_hash(expected)
+    if _loaded.get('key') != key:
+        _loaded.clear()
+        _loaded.update(key=key, layout=ClusterLayout(expected))
+    return _loaded['layout']
+
+def title_text(timestamp, label=None):
+    """Snapshot title for a scan taken at `timestamp` (a datetime), optionally for one page."""
+    if label:
+        return f"Cluster GPU Slots - {label} - {timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+    return f"Cluster GPU Slots - {timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
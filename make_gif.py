@@ -1,41 +1,754 @@
 import glob
-from PIL import Image
+import json
+import zlib
+import struct
+import argparse
+from PIL import Image, ImageColor, GifImagePlugin, features
 import os
 
-def create_gif(image_folder='images', output_file='cluster_history.gif', duration=500):
+import numpy as np
+
+import layout
+import manifest
+
+# --- STREAMING GIF WRITER ---
+
+TRANSPARENT = 255  # palette index marking pixels unchanged from the previous frame
+MAX_DELAY_MS = 0xFFFF * 10  # a frame's delay is 16 bits of 1/100 s
+
+def changed_region(pixels, previous, ignore_top=0):
     """
-    Reads all PNGs from image_folder, sorts them by time, and saves a GIF.
-    duration: milliseconds per frame
+    The box of an index frame that differs from `previous`, as (numpy
+    slice, (left, top) offset, region with unchanged pixels set to
+    TRANSPARENT), or (None, None, None) if nothing below the first
+    `ignore_top` rows changed.
+    """
+    changed = pixels != previous
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows) or rows[-1] < ignore_top:
+        return None, None, None
+    cols = np.flatnonzero(changed[rows[0]:rows[-1] + 1].any(axis=0))
+    box = np.s_[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    # Pixels that did not change become transparent, which compresses far better
+    region = np.where(changed[box], pixels[box], TRANSPARENT).astype(np.uint8)
+    return box, (int(cols[0]), int(rows[0])), region
+
+def boxes_region(frame, boxes):
+    """
+    The bounding box of `boxes` cut from a palette frame, TRANSPARENT
+    outside the boxes themselves, and its (left, top) offset.
+    """
+    offset = (min(box[0] for box in boxes), min(box[1] for box in boxes))
+    size = (max(box[2] for box in boxes) - offset[0], max(box[3] for box in boxes) - offset[1])
+    region = Image.new("P", size, TRANSPARENT)
+    region.putpalette(frame.getpalette())
+    for box in boxes:
+        region.paste(frame.crop(box), (box[0] - offset[0], box[1] - offset[1]))
+    return region, offset
+
+class GifWriter:
+    """
+    Writes an animated GIF to `fp` one frame at a time, so memory does not
+    grow with the number of frames. Only the previous frame (to find the
+    region that changed) and the last encoded frame (whose duration can
+    still grow while identical frames follow) are kept.
+    size: the canvas (width, height).
+    palette: the flat RGB palette shared by every frame (the GIF's global
+    color table), or None if each frame brings its own.
+    ignore_top: rows at the top (the title band) that don't count when
+    deciding whether a frame repeats the previous one; a repeat only
+    extends the previous frame's duration.
+
+    add_indexed() takes frames as indices into the shared palette;
+    add_regions() takes palette frames whose changed regions the caller
+    already knows, such as render_raster.FrameCanvas.
+
+    To append to a GIF written earlier, position `fp` over its trailer and
+    pass the (file offset, duration) of its last frame's data as
+    `last_frame`, and for add_indexed() that frame itself as `previous`.
+    """
+
+    def __init__(self, fp, size, loop=0, previous=None, last_frame=None, ignore_top=0, palette=None):
+        self.fp = fp
+        self.size = size
+        self.loop = loop
+        self.ignore_top = ignore_top
+        self.palette = palette
+        self.previous = previous  # last frame written, as palette indices
+        self.pending = None   # [encoded region, offset, duration] not yet written
+        self.last_frame = last_frame  # (file offset, duration) of the last written frame
+        self.frames = 0
+
+    def add_indexed(self, pixels, duration):
+        """
+        Appends a frame given as a (height, width) array of indices into the
+        shared palette, shown for `duration` milliseconds.
+        """
+        offset = (0, 0)
+        if self.previous is not None:
+            # Only the box that differs from the previous frame is written
+            box, offset, region = changed_region(pixels, self.previous, self.ignore_top)
+            if box is None:
+                self.extend(duration)  # nothing, or only the title, changed
+                return
+            region = Image.fromarray(region)
+            region.putpalette(self.palette)
+            region.info['transparency'] = TRANSPARENT
+        else:
+            region = Image.fromarray(pixels)
+            region.putpalette(self.palette)
+        if self.pending is None and self.last_frame is None:
+            self._header(region, duration)
+        self._flush()
+        self.pending = [region, offset, duration]
+        self.previous = pixels
+        self.frames += 1
+
+    def add_regions(self, frame, boxes, duration):
+        """
+        Appends a frame already in palette mode (not using index TRANSPARENT)
+        given the (left, top, right, bottom) boxes that changed since the
+        previous frame; no boxes extends the previous frame instead. Nothing
+        is diffed or quantized.
+        """
+        if self.pending is None and self.last_frame is None:
+            region, offset = frame.copy(), (0, 0)
+            self._header(region, duration)
+        elif not boxes:
+            self.extend(duration)
+            return
+        else:
+            region, offset = boxes_region(frame, boxes)
+            region.info['transparency'] = TRANSPARENT
+        self._flush()
+        self.pending = [region, offset, duration]
+        self.frames += 1
+
+    def _header(self, image, duration):
+        header, _ = GifImagePlugin.getheader(image, info={'loop': self.loop, 'duration': duration})
+        for chunk in header:
+            self.fp.write(chunk)
+
+    def _flush(self):
+        if self.pending is None:
+            return
+        quantized, offset, duration = self.pending
+        params = {'duration': duration, 'include_color_table': self.palette is None}
+        if 'transparency' in quantized.info:
+            params['transparency'] = quantized.info['transparency']
+        self.last_frame = (self.fp.tell(), duration)
+        for chunk in GifImagePlugin.getdata(quantized, offset, **params):
+            self.fp.write(chunk)
+        self.pending = None
+
+    def extend(self, duration):
+        """Shows the last frame for `duration` milliseconds longer."""
+        current = self.pending[2] if self.pending is not None else self.last_frame[1]
+        if current + duration > MAX_DELAY_MS:
+            # Keep showing it through an empty (fully transparent) 1x1 frame
+            blank = Image.new("P", (1, 1), TRANSPARENT)
+            blank.putpalette(bytes(3 * 256))
+            blank.info['transparency'] = TRANSPARENT
+            self._flush()
+            self.pending = [blank, (0, 0), duration]
+        elif self.pending is not None:
+            self.pending[2] += duration
+        else:
+            self._extend_written(duration)
+
+    def _extend_written(self, duration):
+        """Adds to the delay of the last frame already in the file."""
+        offset, written = self.last_frame
+        self.last_frame = (offset, written + duration)
+        end = self.fp.tell()
+        # Graphic Control Extension: '!', 0xF9, block size, flags, then the delay in 1/100 s
+        self.fp.seek(offset + 4)
+        self.fp.write(struct.pack("<H", (written + duration) // 10))
+        self.fp.seek(end)
+
+    def close(self):
+        """Writes the last frame and the GIF trailer."""
+        self._flush()
+        self.fp.write(b";")
+
+# --- WEBP AND APNG WRITERS ---
+# Same interface as GifWriter, for histories written as animated APNG or
+# WebP instead. Only GIFs can be appended to in place.
+
+# APNG, written chunk by chunk like GifWriter writes GIF blocks: an 8-bit
+# palette image whose frames after the first are the changed box, blended
+# over the previous frame with unchanged pixels transparent.
+APNG_COMPRESSION = 9  # zlib level
+APNG_BLEND_OVER = 1   # fcTL blend_op: draw the region over the previous frame
+
+class ApngWriter:
     """
-    # 1. Find all images
-    file_pattern = os.path.join(image_folder, "*.png")
-    images = glob.glob(file_pattern)
-    
-    # 2. Sort by filename (which contains the timestamp) ensures chronological order
-    images.sort()
+    Writes an animated PNG to `fp`, which must be seekable (the frame count
+    is patched in on close()). APNG has a single palette: the shared
+    `palette` for index frames, else the first frame's, and frames from
+    render_raster.FrameCanvas with another palette are mapped onto it.
+    The arguments are those of GifWriter; appending is not supported.
+    """
+
+    def __init__(self, fp, size, loop=0, ignore_top=0, palette=None):
+        self.fp = fp
+        self.size = size
+        self.loop = loop
+        self.ignore_top = ignore_top
+        self.palette = palette
+        self.previous = None
+        self.pending = None   # [region array, offset, duration] not yet written
+        self.sequence = 0     # next fcTL/fdAT sequence number
+        self.written = 0      # frames in the file
+        self.actl_offset = None
+        self.luts = {}        # palette (as bytes) -> index lookup onto self.palette
+        self.compression = APNG_COMPRESSION
+        self.durations = []   # of the frames in the file
+        self.frames = 0
+
+    def add_indexed(self, pixels, duration):
+        """Like GifWriter.add_indexed()."""
+        offset, region = (0, 0), pixels
+        if self.previous is not None:
+            box, offset, region = changed_region(pixels, self.previous, self.ignore_top)
+            if box is None:
+                self.extend(duration)
+                return
+        self._queue(region, offset, duration)
+        self.previous = pixels
+
+    def add_regions(self, frame, boxes, duration):
+        """Like GifWriter.add_regions()."""
+        if self.pending is None and not self.written:
+            if self.palette is None:
+                self.palette = frame.getpalette()
+            region, offset = frame, (0, 0)
+        elif not boxes:
+            self.extend(duration)
+            return
+        else:
+            region, offset = boxes_region(frame, boxes)
+        pixels = np.asarray(region)
+        if frame.getpalette() != self.palette:
+            pixels = self._lut(frame.getpalette())[pixels]
+        self._queue(pixels, offset, duration)
+
+    def _lut(self, palette):
+        """Maps indices of `palette` to the nearest colors of the APNG's palette, keeping TRANSPARENT."""
+        key = bytes(palette)
+        if key not in self.luts:
+            source = np.array(palette, dtype=np.int32).reshape(-1, 3)
+            target = np.array(self.palette, dtype=np.int32).reshape(-1, 3)[:TRANSPARENT]
+            distance = ((source[:, None, :] - target[None, :, :]) ** 2).sum(axis=2)
+            lut = np.full(256, TRANSPARENT, dtype=np.uint8)
+            lut[:len(source)] = distance.argmin(axis=1)
+            lut[TRANSPARENT] = TRANSPARENT
+            self.luts[key] = lut
+        return self.luts[key]
+
+    def _queue(self, pixels, offset, duration):
+        if self.pending is None and not self.written:
+            self._header()
+        self._flush()
+        self.pending = [pixels, offset, duration]
+        self.frames += 1
+
+    def _header(self):
+        from PIL.PngImagePlugin import putchunk
+
+        palette = (list(self.palette) + [0] * 768)[:768]
+        alpha = bytes([255] * TRANSPARENT + [0])
+        self.fp.write(b"\x89PNG\r\n\x1a\n")
+        putchunk(self.fp, b"IHDR", struct.pack(">IIBBBBB", self.size[0], self.size[1], 8, 3, 0, 0, 0))
+        self.actl_offset = self.fp.tell()
+        putchunk(self.fp, b"acTL", struct.pack(">II", 0, self.loop))  # frame count patched on close
+        putchunk(self.fp, b"PLTE", bytes(palette))
+        putchunk(self.fp, b"tRNS", alpha)
+
+    def _flush(self):
+        from PIL.PngImagePlugin import putchunk
+
+        if self.pending is None:
+            return
+        pixels, offset, duration = self.pending
+        height, width = pixels.shape
+        blend = APNG_BLEND_OVER if self.written else 0
+        putchunk(self.fp, b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, width, height, offset[0], offset[1],
+                                               duration // 10, 100, 0, blend))
+        self.sequence += 1
+        # Every row with filter type 0 (none), which suits palette images
+        rows = np.zeros((height, width + 1), dtype=np.uint8)
+        rows[:, 1:] = pixels
+        data = zlib.compress(rows.tobytes(), self.compression)
+        if self.written:
+            putchunk(self.fp, b"fdAT", struct.pack(">I", self.sequence), data)
+            self.sequence += 1
+        else:
+            putchunk(self.fp, b"IDAT", data)
+        self.durations.append(duration // 10 * 10)
+        self.written += 1
+        self.pending = None
+
+    def extend(self, duration):
+        """Shows the last frame for `duration` milliseconds longer."""
+        if self.pending[2] + duration > MAX_DELAY_MS:
+            # Keep showing it through an empty (fully transparent) 1x1 frame
+            self._flush()
+            self.pending = [np.full((1, 1), TRANSPARENT, dtype=np.uint8), (0, 0), duration]
+        else:
+            self.pending[2] += duration
+
+    def close(self):
+        """Writes the last frame and the end of the file, and patches in the frame count."""
+        from PIL.PngImagePlugin import putchunk
+
+        self._flush()
+        putchunk(self.fp, b"IEND", b"")
+        end = self.fp.tell()
+        self.fp.seek(self.actl_offset)
+        putchunk(self.fp, b"acTL", struct.pack(">II", self.written, self.loop))
+        self.fp.seek(end)
+
+# Animated WebP through Pillow's save_all. It wants the frames and their
+# durations up front, so they are first streamed into a temporary APNG
+# (quickly compressed), which Pillow then decodes one frame at a time.
+WEBP_LOSSLESS = True
+WEBP_QUALITY = 80  # lossy quality, or lossless effort
+WEBP_METHOD = 4    # 0 (fast) to 6 (smallest)
+WEBP_KMIN, WEBP_KMAX = 50, 100  # frames between key frames; every other frame only stores what changed
+WEBP_STAGING_COMPRESSION = 1     # zlib level of the temporary APNG
+
+def webp_supported():
+    """Whether this Pillow can write animated WebP."""
+    if not features.check('webp'):
+        return False
+    # Before Pillow 11, animation support was a separate feature
+    return 'webp_anim' not in features.features or features.check('webp_anim')
+
+class WebpWriter(ApngWriter):
+    """
+    Writes an animated WebP to `fp`. libwebp stores each frame as the
+    rectangle that changed since the previous one (plus a full key frame
+    now and then). Frames are staged in a temporary APNG, so they share
+    one palette as in ApngWriter, and the WebP is encoded on close().
+    The arguments are those of GifWriter; appending is not supported.
+    """
+
+    def __init__(self, fp, size, loop=0, ignore_top=0, palette=None):
+        import tempfile
+
+        self.output = fp
+        super().__init__(tempfile.TemporaryFile(), size, loop, ignore_top, palette)
+        self.compression = WEBP_STAGING_COMPRESSION
+
+    def close(self):
+        """Writes the staged frames as WebP and drops the temporary APNG."""
+        super().close()
+        self.fp.seek(0)
+        try:
+            with Image.open(self.fp) as frames:
+                frames.save(self.output, format="WEBP", save_all=True, duration=self.durations, loop=self.loop,
+                            background=(255, 255, 255, 255), lossless=WEBP_LOSSLESS, quality=WEBP_QUALITY,
+                            method=WEBP_METHOD, kmin=WEBP_KMIN, kmax=WEBP_KMAX)
+        finally:
+            self.fp.close()
+
+# Output format by file extension
+WRITERS = {'.gif': GifWriter, '.webp': WebpWriter, '.png': ApngWriter, '.apng': ApngWriter}
+
+def output_writer(output_file):
+    """The writer class for `output_file`, by extension, or None if unsupported."""
+    return WRITERS.get(os.path.splitext(output_file)[1].lower())
+
+# --- PARALLEL DECODING ---
+# Decoding and quantizing a snapshot is most of the work of a PNG build and,
+# with one palette for the whole GIF, doesn't depend on any other frame. So
+# it runs in a process pool, and only diffing against the previous frame and
+# writing stay sequential, in order.
 
-    if not images:
-        print(f"No images found in {image_folder}")
+# Colors every snapshot is drawn in; the rest of the palette is learned
+STYLE_COLORS = (layout.C_BACKGROUND, '#000000', layout.C_NODE_BG, layout.C_NODE_BORDER, layout.C_TEXT,
+                layout.C_LED_OK, layout.C_LED_OK_EDGE, layout.C_LED_MISS, layout.C_LED_MISS_EDGE)
+PALETTE_SAMPLES = 8              # snapshots the palette is learned from
+PALETTE_SAMPLE_PIXELS = 1000000  # downsampled to about this many pixels in all
+FRAMES_AHEAD = 4                 # frames decoded ahead of the writer, per worker
+
+_palette_images = {}  # palette (as bytes) -> image carrying it, per process
+
+def shared_palette(images, size):
+    """
+    The palette of a GIF of `images`: the style colors, then up to
+    TRANSPARENT colors in all learned from snapshots spread over the
+    history. Returned as a flat RGB list; index TRANSPARENT stays free.
+    """
+    samples = images[::max(1, len(images) // PALETTE_SAMPLES)][:PALETTE_SAMPLES]
+    # Nearest-neighbour downsampling keeps only colors that really occur
+    step = max(1, int((size[0] * size[1] * len(samples) / PALETTE_SAMPLE_PIXELS) ** 0.5 + 0.5))
+    width, height = -(-size[0] // step), -(-size[1] // step)
+    sheet = Image.new("RGB", (width, height * len(samples)), "white")
+    for i, path in enumerate(samples):
+        with Image.open(path) as image:
+            frame = image.convert("RGB")
+        sheet.paste(frame.resize((-(-frame.width // step), -(-frame.height // step)), Image.Resampling.NEAREST),
+                    (0, i * height))
+    learned = sheet.quantize(colors=TRANSPARENT - len(STYLE_COLORS), method=Image.Quantize.MEDIANCUT)
+    style = [value for color in STYLE_COLORS for value in ImageColor.getrgb(color)]
+    return style + learned.getpalette()
+
+def quantize_frame(path, size, palette):
+    """
+    Decodes a snapshot, pads it to `size` with white and maps it onto
+    `palette` without dithering, so pixels that don't change keep their
+    index. Returns the indices as a (height, width) array. Runs in pool
+    workers too.
+    """
+    key = bytes(palette)
+    target = _palette_images.get(key)
+    if target is None:
+        target = _palette_images[key] = Image.new("P", (1, 1))
+        target.putpalette(palette)
+    with Image.open(path) as image:
+        frame = image.convert("RGB")
+    if frame.size != tuple(size):
+        canvas = Image.new("RGB", tuple(size), "white")
+        canvas.paste(frame, (0, 0))
+        frame = canvas
+    return np.asarray(frame.quantize(palette=target, dither=Image.Dither.NONE))
+
+def quantized_frames(paths, size, palette, workers=1):
+    """
+    quantize_frame() of every path, in order. With workers > 1 they are
+    decoded in a process pool, at most FRAMES_AHEAD per worker ahead of the
+    consumer so memory stays bounded.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield quantize_frame(path, size, palette)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(quantize_frame, path, size, palette))
+            if len(pending) >= workers * FRAMES_AHEAD:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def encode_frames(writer, images, duration, previous_path=None, shown_path=None, workers=1,
+                  hashes=None, previous_hash=None):
+    """
+    Feeds snapshot files to `writer`, decoded by `workers` processes. A
+    hard link to the previous snapshot (what generate_gpu_status.py writes
+    for an unchanged cluster with --unchanged link) extends the previous
+    frame without being decoded, and so does a snapshot whose state hash
+    (from the manifest, in `hashes`) matches the previous one's when only
+    the title may differ. When appending, `previous_path` and
+    `previous_hash` describe the last snapshot already in the GIF and
+    `shown_path` the one its last frame shows. Returns the path of the last
+    frame written.
+    """
+    repeats = []
+    for path, state_hash in zip(images, hashes or [None] * len(images)):
+        same_state = state_hash is not None and state_hash == previous_hash and writer.ignore_top > 0
+        repeats.append(previous_path is not None
+                       and (same_state or os.path.samefile(path, previous_path)))
+        previous_path, previous_hash = path, state_hash
+    decoded = [path for path, repeat in zip(images, repeats) if not repeat]
+    frames = quantized_frames(decoded, writer.size, writer.palette, workers)
+
+    shown = shown_path
+    for path, repeat in zip(images, repeats):
+        if repeat:
+            writer.extend(duration)
+            continue
+        written = writer.frames
+        writer.add_indexed(next(frames), duration)
+        if writer.frames > written:
+            shown = path
+    return shown
+
+def encode_states(writer, paths, duration, shown_path=None):
+    """
+    Feeds scan states stored by generate_gpu_status.save_scan_state() to
+    `writer`, drawn on a render_raster.FrameCanvas per topology: only the
+    slots that changed and the title are repainted, and no image is decoded
+    or quantized. Continues from the frame of `shown_path` if given.
+    Returns the path of the last frame written.
+    """
+    import generate_gpu_status
+    import render_raster
+
+    topologies = {}
+    canvas = None
+
+    def new_canvas(table):
+        geometry = layout.cached_layout(table.expected)
+        return render_raster.FrameCanvas(table, geometry, writer.size)
+
+    if shown_path is not None:
+        canvas = new_canvas(generate_gpu_status.load_scan_state(shown_path, topologies))
+    shown = shown_path
+    for path in paths:
+        table = generate_gpu_status.load_scan_state(path, topologies)
+        if canvas is not None and canvas.key == table.topology_hash():
+            boxes = canvas.update(table, keep_title=writer.ignore_top > 0)
+        else:
+            canvas = new_canvas(table)
+            boxes = [(0, 0) + writer.size]
+        written = writer.frames
+        writer.add_regions(canvas.image, boxes, duration)
+        if writer.frames > written:
+            shown = path
+    return shown
+
+def canvas_size(images):
+    """Largest width and height among the image files, read from their headers only."""
+    width = height = 0
+    for path in images:
+        with Image.open(path) as image:
+            width = max(width, image.width)
+            height = max(height, image.height)
+    return width, height
+
+def states_canvas_size(states_folder):
+    """Largest image size among the topologies stored in `states_folder`."""
+    width = height = 0
+    for path in glob.glob(os.path.join(states_folder, "topology_*.npz")):
+        with np.load(path) as topology:
+            size = layout.canvas_size(len(topology['expected']))
+        width = max(width, size[0])
+        height = max(height, size[1])
+    return width, height
+
+# --- INCREMENTAL BUILDS ---
+# After every build a small JSON file next to the GIF records the last
+# snapshot included, the one its last frame shows and where that frame sits
+# in the file, so the next run can append only the newer snapshots instead
+# of re-encoding the history.
+
+def state_path(output_file):
+    return output_file + ".state"
+
+def read_state(output_file):
+    """The saved build state of `output_file`, or None if it can't be appended to."""
+    try:
+        with open(state_path(output_file)) as f:
+            state = json.load(f)
+        if os.path.getsize(output_file) != state['length']:
+            return None  # the GIF was changed or replaced since
+        if 'last_time' not in state:
+            return None  # written by an older make_gif.py
+        return state
+    except (OSError, ValueError, KeyError):
+        return None
+
+def write_state(output_file, entries, shown_image, writer, frames, source, selection):
+    """Saves the build state; `entries` are the manifest entries animated so far, in order."""
+    state = {
+        'source': source,
+        'selection': selection,
+        'last_time': entries[-1].timestamp,
+        'last_hash': entries[-1].state_hash,
+        'last_image': entry_file(entries[-1], source),
+        'shown_image': shown_image,
+        'ignore_top': writer.ignore_top,
+        'size': list(writer.size),
+        'frame_offset': writer.last_frame[0],
+        'frame_duration': writer.last_frame[1],
+        'frames': frames,
+        'length': os.path.getsize(output_file),
+        'palette': writer.palette,
+    }
+    partial = state_path(output_file) + ".partial"
+    with open(partial, 'w') as f:
+        json.dump(state, f)
+    os.replace(partial, state_path(output_file))
+
+def append_frames(output_file, state, image_folder, images, hashes, duration, workers=1):
+    """
+    Appends `images` (PNGs, or scan states if the GIF was built from them)
+    to the GIF described by `state`, in place.
+    Returns the writer and the path of the last frame written.
+    """
+    shown_path = os.path.join(image_folder, state['shown_image'])
+    size = tuple(state['size'])
+    previous = None
+    if state['source'] == 'png':
+        previous = quantize_frame(shown_path, size, state['palette'])
+    with open(output_file, 'r+b') as fp:
+        fp.seek(state['length'] - 1)
+        if fp.read(1) != b";":
+            raise ValueError("no GIF trailer where the build state says")
+        fp.seek(state['length'] - 1)
+        writer = GifWriter(fp, size, previous=previous,
+                           last_frame=(state['frame_offset'], state['frame_duration']),
+                           ignore_top=state['ignore_top'], palette=state['palette'])
+        if state['source'] == 'states':
+            shown = encode_states(writer, images, duration, shown_path)
+        else:
+            shown = encode_frames(writer, images, duration, os.path.join(image_folder, state['last_image']),
+                                  shown_path, workers, hashes, state['last_hash'])
+        writer.close()
+        fp.truncate()
+    return writer, shown
+
+# --- SNAPSHOT SELECTION ---
+
+def entry_file(entry, source):
+    """The file a manifest entry contributes to a GIF built from `source`, or None."""
+    if source == 'states':
+        return entry.state
+    return entry.image if entry.image and entry.image.endswith(".png") else None
+
+def find_snapshots(image_folder, source, since=None, until=None, every=None):
+    """
+    The manifest entries with a file for `source` in the time window, thinned
+    to one per `every` (see manifest.select()). Only a folder without a
+    manifest is listed.
+    """
+    entries = manifest.read(image_folder, since, until)
+    if entries is None:
+        print(f"No snapshot manifest in {image_folder}, listing the folder instead.")
+        entries = manifest.scan_folder(image_folder)
+    entries = [entry for entry in entries if entry_file(entry, source)]
+    return manifest.select(entries, since, until, every)
+
+def create_gif(image_folder='images', output_file='cluster_history.gif', duration=500, incremental=False,
+               collapse=True, from_states=False, workers=1, since=None, until=None, every=None):
+    """
+    Animates the snapshots of image_folder, in scan order, into a GIF, or
+    an animated WebP or APNG if output_file ends in .webp, .png or .apng
+    (see WRITERS).
+    duration: milliseconds per frame
+    Snapshots are found through the manifest that generate_gpu_status.py
+    keeps (see manifest.py); `since` and `until` ('YYYY-MM-DD[ HH:MM:SS]')
+    limit the time window and `every` (e.g. '1d') keeps at most one
+    snapshot per interval.
+    Frames are decoded and quantized to one shared palette by `workers`
+    processes, then written one at a time. With
+    incremental=True, snapshots newer than the last build are appended to
+    an existing GIF when possible, instead of re-encoding all of them.
+    With collapse=True, a run of snapshots that differ only in the title
+    (the scan time) becomes a single frame shown for the whole run.
+    With from_states=True the frames are drawn from the stored scan states
+    (see encode_states()) instead of the PNGs.
+    """
+    writer_class = output_writer(output_file)
+    if writer_class is None:
+        print(f"Unsupported animation format: {output_file} (use .gif, .webp, .png or .apng)")
+        return
+    if writer_class is WebpWriter and not webp_supported():
+        print("This Pillow was built without animated WebP support.")
+        return
+    kind = os.path.splitext(output_file)[1][1:].upper()
+    ignore_top = layout.TITLE_BAND_PX if collapse else 0
+    source = 'states' if from_states else 'png'
+    selection = [since, until, every]
+    entries = find_snapshots(image_folder, source, since, until,
+                             manifest.parse_interval(every) if every else None)
+    if not entries:
+        print(f"No {'scan states' if from_states else 'images'} found in {image_folder}")
         return
 
-    print(f"Found {len(images)} frames. Creating GIF...")
-
-    # 3. Load images using Pillow
-    frames = [Image.open(image) for image in images]
-
-    # 4. Save as GIF
-    # duration is in milliseconds (500ms = 0.5 seconds per frame)
-    frame_one = frames[0]
-    frame_one.save(
-        output_file,
-        format="GIF",
-        append_images=frames[1:],
-        save_all=True,
-        duration=duration,
-        loop=0 # 0 means loop forever
-    )
-    
-    print(f"GIF saved successfully: {output_file}")
+    def paths(entries):
+        return [os.path.join(image_folder, entry_file(entry, source)) for entry in entries]
+
+    def frame_size(entries):
+        if from_states:
+            return max(states_canvas_size(folder) for folder in {os.path.dirname(p) for p in paths(entries)})
+        return canvas_size(paths(entries))
+
+    state = read_state(output_file) if incremental and writer_class is GifWriter else None
+    if state is not None:
+        new_entries = [entry for entry in entries if entry.timestamp > state['last_time']]
+        if not new_entries:
+            print(f"GIF already up to date: {output_file}")
+            return
+        width, height = frame_size(new_entries)
+        if state['source'] != source:
+            print("The GIF was built from other frames (PNGs or scan states), rebuilding.")
+        elif state['selection'] != selection:
+            print("The time window changed since the last build, rebuilding.")
+        elif width > state['size'][0] or height > state['size'][1]:
+            print("New snapshots are larger than the GIF canvas, rebuilding.")
+        elif not all(os.path.exists(os.path.join(image_folder, state[key]))
+                     for key in ('last_image', 'shown_image')):
+            print("Snapshots from the last build are gone, rebuilding.")
+        elif state.get('ignore_top') != ignore_top:
+            print("Repeat collapsing changed since the last build, rebuilding.")
+        else:
+            print(f"Appending {len(new_entries)} new snapshots to {output_file}...")
+            try:
+                writer, shown = append_frames(output_file, state, image_folder, paths(new_entries),
+                                              [entry.state_hash for entry in new_entries], duration,
+                                              workers)
+                write_state(output_file, new_entries, os.path.relpath(shown, image_folder), writer,
+                            state['frames'] + writer.frames, source, selection)
+                print(f"GIF saved successfully: {output_file} ({writer.frames} new frames)")
+                return
+            except (OSError, ValueError) as e:
+                print(f"Could not append to {output_file} ({e}), rebuilding.")
+
+    print(f"Found {len(entries)} frames. Creating {kind}...")
+
+    # Stream the frames into the writer, closing each file as we go.
+    # Write to a temporary file first so a failed run keeps the old one.
+    images = paths(entries)
+    size = frame_size(entries)
+    partial = output_file + ".partial"
+    with open(partial, 'wb') as fp:
+        if from_states:
+            writer = writer_class(fp, size, loop=0, ignore_top=ignore_top) # 0 means loop forever
+            shown = encode_states(writer, images, duration)
+        else:
+            writer = writer_class(fp, size, loop=0, ignore_top=ignore_top, palette=shared_palette(images, size))
+            shown = encode_frames(writer, images, duration, workers=workers,
+                                  hashes=[entry.state_hash for entry in entries])
+        writer.close()
+    os.replace(partial, output_file)
+    if writer_class is GifWriter:
+        write_state(output_file, entries, os.path.relpath(shown, image_folder), writer, writer.frames,
+                    source, selection)
+
+    print(f"{kind} saved successfully: {output_file} ({writer.frames} frames)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Animate the cluster snapshots into a GIF, WebP or APNG")
+    parser.add_argument('--images', default='images', help="Snapshot folder (default: images)")
+    parser.add_argument('--output', default='cluster_history.gif',
+                        help="Animation to write, .gif, .webp or .png/.apng (default: cluster_history.gif)")
+    parser.add_argument('--duration', type=int, default=500,
+                        help="Milliseconds per frame (default: 500)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Re-encode every snapshot instead of appending the new ones")
+    parser.add_argument('--keep-repeats', action='store_true',
+                        help="Give every snapshot its own frame, even if only the time in its title changed")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes decoding and quantizing snapshots (default: 1; a pool only "
+                             "pays off with several idle cores)")
+    parser.add_argument('--since', help="Only snapshots at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument('--until', help="Only snapshots before this time")
+    parser.add_argument('--every', help="At most one snapshot per interval, e.g. 6h, 1d or 1w")
+    parser.add_argument('--from-states', action='store_true',
+                        help="Draw the frames from the scan states in <images>/states instead of "
+                             "decoding the PNGs (much faster, and covers every scan)")
+    args = parser.parse_args(argv)
+    if args.duration < 10:
+        parser.error("--duration must be at least 10 ms (GIF delays are whole centiseconds)")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.every:
+        try:
+            manifest.parse_interval(args.every)
+        except ValueError as e:
+            parser.error(f"--every: {e}")
+    return args
 
 if __name__ == "__main__":
-    create_gif()
+    args = parse_args()
+    create_gif(args.images, args.output, args.duration, incremental=not args.rebuild,
+               collapse=not args.keep_repeats, from_states=args.from_states, workers=args.workers,
+               since=args.since, until=args.until, every=args.every)
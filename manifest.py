@@ -0,0 +1,133 @@
+import os
+import re
+import glob
+import bisect
+import datetime
+
+# The snapshot manifest: an append-only index in the images directory with
+# one line per scan (the scan time, the hash of what its snapshot shows and
+# the files written for it), kept by generate_gpu_status.py. make_gif.py
+# picks its frames from here instead of listing and sorting a directory that
+# grows with every scan.
+
+MANIFEST_NAME = "manifest.tsv"
+MISSING = "-"  # no file of that kind for the scan
+
+class Entry:
+    """One scan in the manifest. `image` and `state` are paths relative to the images directory, or None."""
+    __slots__ = ('timestamp', 'state_hash', 'image', 'state')
+
+    def __init__(self, timestamp, state_hash=None, image=None, state=None):
+        self.timestamp = timestamp  # 'YYYY-MM-DD HH:MM:SS'
+        self.state_hash = state_hash
+        self.image = image
+        self.state = state
+
+    def __repr__(self):
+        return f"Entry({self.timestamp!r}, image={self.image!r}, state={self.state!r})"
+
+def manifest_path(folder):
+    return os.path.join(folder, MANIFEST_NAME)
+
+def _line(entry):
+    fields = [entry.timestamp, entry.state_hash, entry.image, entry.state]
+    return "\t".join(MISSING if field is None else field for field in fields) + "\n"
+
+def append(folder, timestamp, state_hash, image=None, state=None):
+    """
+    Adds a scan (a datetime) and the files written for it to the manifest of
+    `folder`. The first call also lists the snapshots already in the folder
+    into it, so they stay part of the history.
+    """
+    entry = Entry(timestamp.isoformat(sep=' ', timespec='seconds'), state_hash,
+                  *[os.path.relpath(path, folder) if path else None for path in (image, state)])
+    path = manifest_path(folder)
+    try:
+        lines = []
+        if not os.path.exists(path):
+            for old in scan_folder(folder):
+                if (old.state is not None and old.state == entry.state) or \
+                        (old.image is not None and old.image == entry.image):
+                    continue  # this scan's own files
+                old.timestamp = min(old.timestamp, entry.timestamp)  # keep the lines in scan order
+                lines.append(_line(old))
+        with open(path, 'a') as f:
+            f.write("".join(lines) + _line(entry))
+    except OSError as e:
+        print(f"Could not update the snapshot manifest in {folder}: {e}")
+
+def read(folder, since=None, until=None):
+    """
+    The entries of the manifest of `folder`, in scan order, or None if it has
+    none. With `since`/`until` only the lines in that window are parsed: they
+    start with the scan time and are appended in scan order, so the window
+    is found by bisection.
+    """
+    try:
+        with open(manifest_path(folder)) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    first = bisect.bisect_left(lines, since) if since else 0
+    last = bisect.bisect_left(lines, until, first) if until else len(lines)
+    entries = []
+    for line in lines[first:last]:
+        fields = line.split("\t")
+        if len(fields) != 4:
+            continue  # a line cut short by a crash
+        timestamp, state_hash, image, state = [None if field == MISSING else field for field in fields]
+        entries.append(Entry(timestamp, state_hash, image, state))
+    return entries
+
+def scan_folder(folder):
+    """
+    Entries for the snapshots of a folder without a manifest (from before it
+    existed), timed by the timestamp in their file names. Lists the
+    directory. Every PNG counts, as make_gif.py always animated them all;
+    one without a timestamp in its name is timed by its modification time.
+    """
+    by_stamp = {}
+    patterns = [('image', "*.png"), ('state', os.path.join("states", "status_*.npz"))]
+    for kind, pattern in patterns:
+        for path in glob.glob(os.path.join(folder, pattern)):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                timestamp = datetime.datetime.strptime(name, 'status_%Y%m%d_%H%M%S')
+            except ValueError:
+                if kind == 'state':
+                    continue
+                name = path  # its own entry
+                timestamp = datetime.datetime.fromtimestamp(int(os.path.getmtime(path)))
+            entry = by_stamp.setdefault(name, Entry(timestamp.isoformat(sep=' ')))
+            setattr(entry, kind, os.path.relpath(path, folder))
+    return sorted(by_stamp.values(), key=lambda entry: (entry.timestamp, entry.image or ""))
+
+# --- SELECTION ---
+
+INTERVAL_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+def parse_interval(text):
+    """'30m', '12h', '1d' or '2w' as a timedelta."""
+    match = re.fullmatch(r"(\d+)([mhdw])", text.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"not an interval like 12h or 1d: {text!r}")
+    return datetime.timedelta(**{INTERVAL_UNITS[match.group(2)]: int(match.group(1))})
+
+def select(entries, since=None, until=None, every=None):
+    """
+    The entries at or after `since` and before `until` ('YYYY-MM-DD[ HH:MM:SS]'
+    strings), thinned to at most one per `every` (a timedelta): a scan is
+    kept if it comes at least that long after the last one kept.
+    """
+    selected = [entry for entry in entries
+                if (not since or entry.timestamp >= since) and (not until or entry.timestamp < until)]
+    if every is None:
+        return selected
+    thinned = []
+    next_time = None
+    for entry in selected:
+        timestamp = datetime.datetime.fromisoformat(entry.timestamp)
+        if next_time is None or timestamp >= next_time:
+            thinned.append(entry)
+            next_time = timestamp + every
+    return thinned
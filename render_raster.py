@@ -0,0 +1,181 @@
+import os
+import datetime
+import functools
+import importlib.util
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+import layout
+
+# Paints the same chassis/LED grid as the matplotlib renderer straight into a
+# Pillow canvas. Uses the shared geometry in layout.py, and never imports
+# matplotlib.
+
+# --- FONTS ---
+
+def _bundled_font_path(filename):
+    """Path to one of matplotlib's bundled fonts, located without importing matplotlib."""
+    spec = importlib.util.find_spec("matplotlib")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(spec.submodule_search_locations[0], "mpl-data", "fonts", "ttf", filename)
+    return path if os.path.exists(path) else None
+
+@functools.lru_cache(maxsize=None)
+def load_font(points, bold=False, italic=False):
+    """DejaVu Sans (matplotlib's default font) at `points`, sized for layout.DPI."""
+    style = ("Bold" if bold else "") + ("Oblique" if italic else "")
+    filename = f"DejaVuSans-{style}.ttf" if style else "DejaVuSans.ttf"
+    size = round(layout.points_to_pixels(points))
+    for candidate in (filename, _bundled_font_path(filename)):
+        if candidate is None:
+            continue
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    print(f"Font {filename} not found, using Pillow's default font")
+    return ImageFont.load_default()
+
+# --- DRAWING ---
+
+def led_boxes(geometry):
+    """
+    Pixel box (inclusive) of every GPU slot. Matplotlib strokes centered on
+    the outline, Pillow inside it, so each box is grown by half the line width.
+    """
+    led_lw = layout.points_to_pixels(layout.LED_LINEWIDTH)
+    grow = np.array([-led_lw, -led_lw, led_lw, led_lw]) / 2
+    return (geometry.led_pixel_boxes() + grow).round().astype(int)
+
+def led_line_width():
+    return max(1, round(layout.points_to_pixels(layout.LED_LINEWIDTH)))
+
+def draw_title(draw, geometry, title, fill='#000000'):
+    draw.text((geometry.width_px / 2, layout.TITLE_BASELINE_PX), title,
+              font=load_font(layout.TITLE_FONTSIZE, bold=True), fill=fill, anchor='ms')
+
+def draw_chassis(draw, table, geometry):
+    """Node chassis boxes with their name and model labels: everything but the slots and title."""
+    # 1. Node Chassis Containers, grown by half the line width like the LEDs
+    chassis_lw = layout.points_to_pixels(layout.CHASSIS_LINEWIDTH)
+    grow = np.array([-chassis_lw, -chassis_lw, chassis_lw, chassis_lw]) / 2
+    boxes = (geometry.chassis_pixel_boxes() + grow).round().astype(int)
+    radius = round(geometry.chassis_pixel_radius())
+    for box in boxes.tolist():
+        draw.rounded_rectangle(box, radius, fill=layout.C_NODE_BG, outline=layout.C_NODE_BORDER,
+                               width=round(chassis_lw))
+
+    # Node Name & Model Text (anchored at the middle of the baseline, like ha='center')
+    name_font = load_font(layout.NAME_FONTSIZE, bold=True)
+    model_font = load_font(layout.MODEL_FONTSIZE, italic=True)
+    center_x, name_y, model_y = geometry.label_pixels()
+    labels = zip(center_x.tolist(), name_y.tolist(), model_y.tolist(), table.names, table.model_names())
+    for cx, ny, my, name, model in labels:
+        draw.text((cx, ny), name, font=name_font, fill=layout.C_TEXT, anchor='ms')
+        draw.text((cx, my), model, font=model_font, fill=layout.C_TEXT, anchor='ms')
+
+def render(table, geometry, title=None):
+    """The cluster image for a ScanTable/ClusterLayout pair, as an RGB Pillow image."""
+    image = Image.new("RGB", (geometry.width_px, geometry.height_px), layout.C_BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    draw_title(draw, geometry, title or layout.title_text(table.timestamp))
+    draw_chassis(draw, table, geometry)
+
+    # 2. GPU Slots (LEDs): Green if present, Red if missing slot
+    colors = {True: (layout.C_LED_OK, layout.C_LED_OK_EDGE),
+              False: (layout.C_LED_MISS, layout.C_LED_MISS_EDGE)}
+    width = led_line_width()
+    for box, present in zip(led_boxes(geometry).tolist(), geometry.slot_present(table.actual).tolist()):
+        fill, edge = colors[present]
+        draw.rectangle(box, fill=fill, outline=edge, width=width)
+    return image
+
+def draw_cluster(table, geometry, filename, title=None):
+    """
+    Draws the cluster image for a ScanTable/ClusterLayout pair and saves it as
+    a PNG, titled `title` (default: the scan time).
+    """
+    render(table, geometry, title).save(filename)
+
+# --- ANIMATION FRAMES ---
+# An animation redraws one topology over and over with a few slots and the
+# title changing. A FrameCanvas draws and quantizes the static part once and
+# then repaints only what changed, straight in palette indices.
+
+PALETTE_SIZE = 255  # GIF frames keep index 255 for transparency
+FIXED_COLORS = (layout.C_BACKGROUND, '#000000', layout.C_LED_OK, layout.C_LED_OK_EDGE,
+                layout.C_LED_MISS, layout.C_LED_MISS_EDGE)
+# Any title works for sampling the anti-aliased shades of its text
+SAMPLE_TITLE = layout.title_text(datetime.datetime(2000, 1, 1))
+
+class FrameCanvas:
+    """
+    The cluster image of one topology in palette ("P") mode, brought from
+    scan to scan with update(). The palette depends on the topology only, so
+    every frame shares it: colors don't flicker and nothing is quantized per
+    frame. `size` (at least the layout's) pads the canvas with background.
+    """
+
+    def __init__(self, table, geometry, size=None, title=None):
+        self.key = table.topology_hash()
+        self.geometry = geometry
+        self.size = size or (geometry.width_px, geometry.height_px)
+
+        static = Image.new("RGB", self.size, layout.C_BACKGROUND)
+        draw_chassis(ImageDraw.Draw(static), table, geometry)
+        sample = static.copy()
+        draw_title(ImageDraw.Draw(sample), geometry, SAMPLE_TITLE)
+        adaptive = sample.quantize(colors=PALETTE_SIZE - len(FIXED_COLORS), method=Image.Quantize.MEDIANCUT)
+        palette = [value for color in FIXED_COLORS for value in ImageColor.getrgb(color)]
+        palette += adaptive.getpalette()
+        self.palette = Image.new("P", (1, 1))
+        self.palette.putpalette(palette)
+        self.colors = {False: (4, 5), True: (2, 3)}  # (fill, edge) indices, see FIXED_COLORS
+
+        self.image = static.quantize(palette=self.palette, dither=Image.Dither.NONE)
+        self.draw = ImageDraw.Draw(self.image)
+        self.leds = led_boxes(geometry)
+        self.led_width = led_line_width()
+        self.present = geometry.slot_present(table.actual)
+        for slot in range(len(self.present)):
+            self._paint_slot(slot)
+        self._retitle(title or layout.title_text(table.timestamp))
+
+    def _paint_slot(self, slot):
+        fill, edge = self.colors[bool(self.present[slot])]
+        box = self.leds[slot].tolist()
+        self.draw.rectangle(box, fill=fill, outline=edge, width=self.led_width)
+        return (box[0], box[1], box[2] + 1, box[3] + 1)
+
+    def _retitle(self, title):
+        """Replaces the title. Returns the box that changed, or None."""
+        band = Image.new("RGB", (self.geometry.width_px, layout.TITLE_BAND_PX), layout.C_BACKGROUND)
+        draw_title(ImageDraw.Draw(band), self.geometry, title)
+        band = band.quantize(palette=self.palette, dither=Image.Dither.NONE)
+        current = self.image.crop((0, 0) + band.size)
+        rows, cols = np.nonzero(np.asarray(band) != np.asarray(current))
+        if not len(rows):
+            return None
+        box = (int(cols.min()), int(rows.min()), int(cols.max()) + 1, int(rows.max()) + 1)
+        self.image.paste(band.crop(box), box)
+        return box
+
+    def update(self, table, title=None, keep_title=False):
+        """
+        Brings the canvas to `table`, which must have this canvas's topology:
+        repaints the slots that changed color and the title (with
+        keep_title=True, only along with a slot change). Returns the boxes
+        that changed, as (left, top, right, bottom), empty if none did.
+        """
+        present = self.geometry.slot_present(table.actual)
+        changed = np.flatnonzero(present != self.present)
+        if keep_title and not len(changed):
+            return []
+        self.present = present
+        boxes = [self._paint_slot(slot) for slot in changed.tolist()]
+        title_box = self._retitle(title or layout.title_text(table.timestamp))
+        if title_box is not None:
+            boxes.append(title_box)
+        return boxes
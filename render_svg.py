@@ -0,0 +1,95 @@
+from html import escape
+
+import numpy as np
+
+import layout
+
+# Writes the chassis/LED grid as SVG. Everything but the title and the color
+# class of each GPU slot is fixed by the topology, so it is laid out once into
+# a %-format template and each later scan is a single string substitution.
+
+TEMPLATE_CACHE_SIZE = 64  # topologies kept (full snapshot plus pages/views)
+
+_templates = {}  # ScanTable.topology_hash() -> template string
+
+# --- TEMPLATE ---
+
+def _static(text):
+    """Protects literal text from the %-substitution."""
+    return text.replace('%', '%%')
+
+def _px(value):
+    return f"{value:.1f}"
+
+def build_template(table, geometry):
+    """
+    The SVG for a topology with a %s for the title and one %s for the class
+    ('ok' or 'miss') of every GPU slot, in geometry slot order.
+    """
+    width, height = geometry.width_px, geometry.height_px
+    chassis_lw = layout.points_to_pixels(layout.CHASSIS_LINEWIDTH)
+    led_lw = layout.points_to_pixels(layout.LED_LINEWIDTH)
+    parts = [_static(f"""<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" font-family="DejaVu Sans, Verdana, sans-serif">
+<style>
+.title{{font-size:{_px(layout.points_to_pixels(layout.TITLE_FONTSIZE))}px;font-weight:bold;text-anchor:middle}}
+.chassis{{fill:{layout.C_NODE_BG};stroke:{layout.C_NODE_BORDER};stroke-width:{_px(chassis_lw)}}}
+.name{{font-size:{_px(layout.points_to_pixels(layout.NAME_FONTSIZE))}px;font-weight:bold;fill:{layout.C_TEXT};text-anchor:middle}}
+.model{{font-size:{_px(layout.points_to_pixels(layout.MODEL_FONTSIZE))}px;font-style:italic;fill:{layout.C_TEXT};text-anchor:middle}}
+.ok,.miss{{stroke-width:{_px(led_lw)}}}
+.ok{{fill:{layout.C_LED_OK};stroke:{layout.C_LED_OK_EDGE}}}
+.miss{{fill:{layout.C_LED_MISS};stroke:{layout.C_LED_MISS_EDGE}}}
+</style>
+<rect width="{width}" height="{height}" fill="{layout.C_BACKGROUND}"/>
+<text class="title" x="{_px(width / 2)}" y="{layout.TITLE_BASELINE_PX}">""")]
+    parts.append("%s</text>\n")
+
+    # 1. Node Chassis Containers
+    radius = _px(geometry.chassis_pixel_radius())
+    for l, t, r, b in geometry.chassis_pixel_boxes().tolist():
+        parts.append(f'<rect class="chassis" x="{_px(l)}" y="{_px(t)}" width="{_px(r - l)}" '
+                     f'height="{_px(b - t)}" rx="{radius}"/>\n')
+
+    # Node Name & Model Text
+    center_x, name_y, model_y = geometry.label_pixels()
+    labels = zip(center_x.tolist(), name_y.tolist(), model_y.tolist(), table.names, table.model_names())
+    for cx, ny, my, name, model in labels:
+        parts.append(_static(f'<text class="name" x="{_px(cx)}" y="{_px(ny)}">{escape(name)}</text>\n'
+                             f'<text class="model" x="{_px(cx)}" y="{_px(my)}">{escape(model)}</text>\n'))
+
+    # 2. GPU Slots (LEDs), colored per scan through their class
+    boxes = geometry.led_pixel_boxes()
+    size = ""
+    if len(boxes):
+        led_w, led_h = (boxes[0, 2:] - boxes[0, :2]).tolist()
+        size = f'width="{_px(led_w)}" height="{_px(led_h)}"'
+    for l, t in boxes[:, :2].tolist():
+        parts.append(f'<rect class="%s" x="{_px(l)}" y="{_px(t)}" {size}/>\n')
+
+    parts.append("</svg>\n")
+    return "".join(parts)
+
+def cached_template(table, geometry):
+    """build_template(), memoized on the table's topology."""
+    key = table.topology_hash()
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            del _templates[next(iter(_templates))]
+        template = _templates[key] = build_template(table, geometry)
+    return template
+
+# --- DRAWING ---
+
+def render(table, geometry, title=None):
+    """The SVG document for a ScanTable/ClusterLayout pair, as a string."""
+    classes = np.where(geometry.slot_present(table.actual), 'ok', 'miss').tolist()
+    title = escape(title or layout.title_text(table.timestamp))
+    return cached_template(table, geometry) % (title, *classes)
+
+def draw_cluster(table, geometry, filename, title=None):
+    """
+    Writes the cluster image for a ScanTable/ClusterLayout pair as an SVG file,
+    titled `title` (default: the scan time).
+    """
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(render(table, geometry, title))
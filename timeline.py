@@ -0,0 +1,176 @@
+import time
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import history
+import layout
+from render_raster import load_font
+
+# Draws the whole scan history as one node x scan heatmap: a row per node, a
+# column per scan, colored by how many GPUs the node had against what it was
+# expected to have. Months of scans become a single small PNG, where a slot
+# going missing shows up as a red streak.
+
+# --- STYLE ---
+
+C_NO_DATA = '#f2f2f2'    # node not in that scan
+C_OVER = '#f39c12'       # more GPUs than expected
+C_MISS_LIGHT = '#f5b7b1' # one GPU missing, shading to C_LED_MISS_EDGE at MAX_MISSING
+MAX_MISSING = 4
+
+WIDTH_PX = 1400
+LABEL_W = 110          # node name column
+AXIS_H = 24            # date labels under the title
+MAX_CELL_W = 12
+ROW_H = 12             # with node names
+MAX_LABELED_NODES = 400
+COMPACT_ROW_H = 2      # more nodes than that: no names, thin rows
+TICK_SPACING_PX = 130  # minimum distance between date labels
+
+# --- COLOR CODES ---
+
+def _hex_rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+def color_codes(delta, status, value='delta'):
+    """
+    Per-cell indices into the palette from palette(value): 0 for no data,
+    then the status (value='status') or the clipped GPU difference ('delta').
+    """
+    if value == 'status':
+        codes = status.astype(np.int16) + 1
+    else:
+        codes = np.clip(delta, -MAX_MISSING, 1) + MAX_MISSING + 1
+        codes[status < 0] = 0
+    return codes.astype(np.uint8)
+
+def palette(value='delta'):
+    """RGB rows for the codes of color_codes(), as a (n, 3) uint8 array."""
+    if value == 'status':
+        colors = [C_NO_DATA, layout.C_LED_OK, layout.C_LED_MISS, C_OVER]
+        return np.array([_hex_rgb(c) for c in colors], dtype=np.uint8)
+    light = np.array(_hex_rgb(C_MISS_LIGHT), dtype=float)
+    dark = np.array(_hex_rgb(layout.C_LED_MISS_EDGE), dtype=float)
+    # -MAX_MISSING .. -1 from dark to light, then 0 and +1 or more
+    missing = [dark + (light - dark) * i / max(1, MAX_MISSING - 1) for i in range(MAX_MISSING)]
+    rows = [_hex_rgb(C_NO_DATA)] + missing + [_hex_rgb(layout.C_LED_OK), _hex_rgb(C_OVER)]
+    return np.array(rows, dtype=np.uint8)
+
+def legend(value='delta'):
+    """(code, label) pairs shown in the legend."""
+    if value == 'status':
+        return [(1, "OK"), (2, "DEGRADED"), (3, "OVER"), (0, "no data")]
+    return [(MAX_MISSING + 1, "OK"), (MAX_MISSING, "1 missing"), (1, f"{MAX_MISSING}+ missing"),
+            (MAX_MISSING + 2, "over"), (0, "no data")]
+
+# --- BINNING ---
+
+STATUS_SEVERITY = np.array([0, 1, 3, 2], dtype=np.int8)  # by status + 1: no data, OK, DEGRADED, OVER
+
+def bin_scans(delta, status, n_columns):
+    """
+    Merges runs of consecutive scans so at most `n_columns` remain, keeping
+    each node's worst scan per run: the most GPUs missing, else the most
+    extra; DEGRADED over OVER over OK over no data. Returns the index of
+    the first scan of every column and the binned delta and status arrays.
+    """
+    n_scans = delta.shape[1]
+    if n_scans <= n_columns:
+        return np.arange(n_scans), delta, status
+    starts = np.unique(np.linspace(0, n_scans, n_columns, endpoint=False).astype(np.int64))
+    present = status >= 0
+    info = np.iinfo(np.int16)
+    lowest = np.minimum.reduceat(np.where(present, delta, info.max), starts, axis=1)
+    highest = np.maximum.reduceat(np.where(present, delta, info.min), starts, axis=1)
+    severity = np.maximum.reduceat(STATUS_SEVERITY[status + 1], starts, axis=1)
+    binned_status = np.argsort(STATUS_SEVERITY)[severity].astype(np.int8) - 1
+    binned_delta = np.where(lowest < 0, lowest, np.where(binned_status < 0, 0, highest)).astype(np.int16)
+    return starts, binned_delta, binned_status
+
+# --- DRAWING ---
+
+def render(times, names, delta, status, value='delta'):
+    """
+    The heatmap image (RGB) of slot_matrix() output. With more scans than
+    pixel columns, runs of scans share a column (see bin_scans()), so the
+    width stays WIDTH_PX however long the history.
+    """
+    labeled = delta.shape[0] <= MAX_LABELED_NODES
+    row_h = ROW_H if labeled else COMPACT_ROW_H
+    label_w = LABEL_W if labeled else layout.MARGIN_PX
+    starts, delta, status = bin_scans(delta, status, WIDTH_PX - label_w - layout.MARGIN_PX)
+    n_nodes, n_scans = delta.shape
+    cell_w = int(np.clip((WIDTH_PX - label_w - layout.MARGIN_PX) // max(1, n_scans), 1, MAX_CELL_W))
+    top = layout.TITLE_BAND_PX + AXIS_H
+    width = WIDTH_PX
+    height = top + n_nodes * row_h + layout.MARGIN_PX
+
+    image = Image.new("RGB", (width, height), layout.C_BACKGROUND)
+    colors = palette(value)
+
+    # The whole grid is one lookup and one nearest-neighbour scale
+    if n_nodes and n_scans:
+        cells = Image.fromarray(colors[color_codes(delta, status, value)])
+        image.paste(cells.resize((n_scans * cell_w, n_nodes * row_h), Image.Resampling.NEAREST), (label_w, top))
+
+    draw = ImageDraw.Draw(image)
+    span = f"{times[0][:16]} to {times[-1][:16]}" if times else "no scans"
+    draw.text((layout.MARGIN_PX, layout.TITLE_BASELINE_PX), f"Cluster GPU Timeline - {span}",
+              font=load_font(layout.TITLE_FONTSIZE, bold=True), fill='#000000', anchor='ls')
+
+    # Legend, right-aligned in the title band
+    font = load_font(layout.MODEL_FONTSIZE)
+    x = width - layout.MARGIN_PX
+    for code, label in reversed(legend(value)):
+        x -= draw.textlength(label, font=font)
+        draw.text((x, layout.TITLE_BASELINE_PX), label, font=font, fill=layout.C_TEXT, anchor='ls')
+        x -= 16
+        draw.rectangle((x, layout.TITLE_BASELINE_PX - 10, x + 10, layout.TITLE_BASELINE_PX),
+                       fill=tuple(colors[code].tolist()), outline=layout.C_NODE_BORDER)
+        x -= 14
+
+    # Date axis: a label every few scans
+    every = max(1, -(-TICK_SPACING_PX // cell_w))
+    for i in range(0, n_scans, every):
+        x = label_w + i * cell_w
+        label = times[starts[i]][:10]
+        if x + draw.textlength(label, font=font) > width:
+            break
+        draw.line((x, top - 6, x, top - 1), fill=layout.C_NODE_BORDER)
+        draw.text((x, top - 8), label, font=font, fill=layout.C_TEXT, anchor='ls')
+
+    if labeled:
+        for row, name in enumerate(names):
+            draw.text((label_w - 6, top + row * row_h + row_h / 2), name, font=font,
+                      fill=layout.C_TEXT, anchor='rm')
+    return image
+
+def draw_timeline(store, filename, since=None, until=None, value='delta'):
+    """Writes the heatmap of a history.ScanHistory as a PNG. Returns (nodes, scans)."""
+    times, names, delta, status = store.slot_matrix(since, until)
+    render(times, names, delta, status, value).save(filename)
+    return delta.shape
+
+# --- COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw the scan history as a node x time heatmap")
+    parser.add_argument('--db', default=history.DEFAULT_DB, help=f"History database (default: {history.DEFAULT_DB})")
+    parser.add_argument('--since', help="Only scans at or after this time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument('--until', help="Only scans before this time")
+    parser.add_argument('--value', choices=['delta', 'status'], default='delta',
+                        help="Color by GPUs missing or extra (default) or by status only")
+    parser.add_argument('--output', default='cluster_timeline.png',
+                        help="PNG to write (default: cluster_timeline.png)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    store = history.ScanHistory(history.connect(args.db))
+    n_nodes, n_scans = draw_timeline(store, args.output, args.since, args.until, args.value)
+    print(f"Timeline saved to: {args.output} ({n_nodes} nodes x {n_scans} scans, "
+          f"{time.perf_counter() - start:.2f}s)")
+
+if __name__ == "__main__":
+    main()